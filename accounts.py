@@ -0,0 +1,57 @@
+import json
+import os
+from config import cookie_domain
+
+# Browser cookie name -> environment variable holding its value
+COOKIE_ENV_VARS = {
+    "master_access_token": "UPWORK_MASTER_TOKEN",
+    "oauth2_global_js_token": "UPWORK_OAUTH_TOKEN",
+    "visitor_id": "UPWORK_VISITOR_ID",
+    "__cf_bm": "UPWORK_CF_BM",
+}
+
+
+def build_cookies(values, account="default"):
+    """Turn {cookie name: value} into the cookie list Playwright expects"""
+    # Check for main token presence
+    token = values.get("master_access_token")
+    if not token or token == "your_master_token_here":
+        if account == "default":
+            raise ValueError("Please set your UPWORK_MASTER_TOKEN in .env file")
+        raise ValueError(f"Account {account} has no master_access_token")
+
+    return [
+        {"name": name, "value": value, "domain": cookie_domain(), "path": "/"}
+        for name, value in values.items()
+        if value
+    ]
+
+
+def get_cookies():
+    """Get all required cookies from environment variables"""
+    return build_cookies(
+        {name: os.getenv(variable) for name, variable in COOKIE_ENV_VARS.items()}
+    )
+
+
+def load_accounts(path=None):
+    """Load [(name, cookies)] from a JSON accounts file.
+
+    The file holds a list of {"name": ..., "cookies": {cookie name: value}}
+    objects. Without a file, the single account from the environment is used.
+    """
+    path = path or os.getenv("UPWORK_ACCOUNTS_FILE")
+    if not path:
+        return [("default", get_cookies())]
+
+    with open(path, encoding="utf-8") as f:
+        entries = json.load(f)
+    if not entries:
+        raise ValueError(f"No accounts in {path}")
+    return [
+        (
+            entry.get("name", f"account-{i}"),
+            build_cookies(entry["cookies"], entry.get("name", f"account-{i}")),
+        )
+        for i, entry in enumerate(entries, 1)
+    ]
@@ -0,0 +1,600 @@
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import datetime
+from urllib.parse import urlparse
+from playwright.async_api import (
+    async_playwright,
+    Error as PlaywrightError,
+    TimeoutError as PlaywrightTimeoutError,
+)
+from browser_pool import LAUNCH_ARGS
+from config import absolute_url, job_key
+from parent_jobs import search_url
+from pipeline import record_in_progress_job, record_parent_job
+from extraction import (
+    IN_PROGRESS_JOB,
+    IN_PROGRESS_LIST,
+    IN_PROGRESS_SECTION,
+    JOB_DESCRIPTION,
+    JOB_TITLE,
+    LISTING,
+    PARENT_JOB,
+    extract_async,
+    job_location,
+)
+from frontier import SEARCH, PARENT, IN_PROGRESS
+from http_fetch import get_http_fetcher
+from memory_watch import MemoryWatch, launch_tracked_async, start_tracked_async
+from metrics import get_metrics
+from resource_blocking import ResourceBlocker
+from session_cache import AssetCache, SessionStore
+from rate_limiter import get_rate_limiter
+from readiness import details_from_document, expand_in_progress_async
+from search_queries import load_queries, pending_queries, unseen_stop
+from retry import (
+    RetryPolicy,
+    BlockedError,
+    PermanentError,
+    TransientError,
+    raise_for_status,
+)
+
+
+class PolitenessBudget:
+    """Limits shared by every task: open pages per host and the adaptive request rate"""
+
+    def __init__(self, concurrency=3, limiter=None):
+        self.concurrency = max(1, concurrency)
+        self.limiter = limiter or get_rate_limiter()
+        self._semaphores = {}
+
+    @asynccontextmanager
+    async def slot(self, url):
+        """Hold one of the host's concurrency slots"""
+        host = urlparse(url).netloc
+        semaphore = self._semaphores.setdefault(
+            host, asyncio.Semaphore(self.concurrency)
+        )
+        async with semaphore:
+            yield
+
+    async def navigate(self, page, url):
+        """Open url once the rate limiter allows it; see browser_pool.navigate"""
+        await self.limiter.wait_async()
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        with get_metrics().span("page.goto"):
+            response = await page.goto(url)
+        security_check = await is_security_check(page)
+        self.limiter.record(
+            response.status if response else None,
+            loop.time() - started,
+            captcha=security_check,
+        )
+        return response, security_check
+
+
+class AsyncBrowserPool:
+    """Async counterpart of BrowserPool: one browser, contexts shared by concurrent pages.
+
+    When the memory watch asks for a recycle, new pages go to a freshly
+    launched browser. The old one is closed once its last page is done.
+    """
+
+    def __init__(
+        self,
+        cookies=None,
+        size=2,
+        max_pages_per_context=50,
+        headless=True,
+        blocker=None,
+        session=None,
+        asset_cache=None,
+        memory=None,
+    ):
+        self.cookies = cookies
+        self.size = max(1, size)
+        self.max_pages_per_context = max(1, max_pages_per_context)
+        self.headless = headless
+        self.blocker = blocker
+        self.session = session
+        self.asset_cache = asset_cache
+        self.memory = memory
+        self.browser_launches = 0
+        self._playwright = None
+        self._driver_pid = None
+        self._browser = None
+        self._slots = []
+        self._next_slot = 0
+        # Open contexts per browser, so a recycled browser is closed with its last one
+        self._open_contexts = {}
+        self._lock = asyncio.Lock()
+
+    async def __aenter__(self):
+        self._playwright, self._driver_pid = await start_tracked_async(
+            lambda: async_playwright().start()
+        )
+        await self._launch_browser()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        for slot in self._slots:
+            if slot is not None:
+                await self._close_context(slot)
+        if self._browser is not None:
+            try:
+                await self._browser.close()
+            except PlaywrightError:
+                pass
+        await self._playwright.stop()
+        if self.blocker:
+            self.blocker.report()
+        if self.asset_cache:
+            self.asset_cache.report()
+        if self.memory:
+            self.memory.report()
+
+    async def _launch_browser(self):
+        print("Launching browser...")
+        self._browser, pid = await launch_tracked_async(
+            lambda: self._playwright.chromium.launch(
+                headless=self.headless, args=LAUNCH_ARGS
+            ),
+            self._driver_pid,
+        )
+        if self.memory:
+            self.memory.launched(pid)
+        self.browser_launches += 1
+        get_metrics().incr("browser_launches")
+        self._slots = [None] * self.size
+
+    async def _new_slot(self):
+        options = self.session.context_options() if self.session else {}
+        context = await self._browser.new_context(**options)
+        cookies = (
+            self.session.missing_cookies(options.get("storage_state"))
+            if self.session
+            else self.cookies
+        )
+        if cookies:
+            await context.add_cookies(cookies)
+        browser = self._browser
+        self._open_contexts[browser] = self._open_contexts.get(browser, 0) + 1
+        return {
+            "context": context,
+            "browser": browser,
+            "pages": 0,
+            "active": 0,
+            "retired": False,
+        }
+
+    async def _close_context(self, slot, crashed=False):
+        if self.session and not crashed:
+            await self.session.save_async(slot["context"], force=True)
+        try:
+            await slot["context"].close()
+        except PlaywrightError:
+            pass
+        browser = slot["browser"]
+        if browser not in self._open_contexts:
+            return
+        self._open_contexts[browser] -= 1
+        if not self._open_contexts[browser] and browser is not self._browser:
+            # The last context of a recycled browser
+            del self._open_contexts[browser]
+            await self._close_browser(browser)
+
+    async def _close_browser(self, browser):
+        try:
+            await browser.close()
+        except PlaywrightError:
+            pass
+
+    async def _recycle_browser(self, reason):
+        """Send new pages to a fresh browser; the old one closes when its pages are done"""
+        self.memory.recycling(reason)
+        old = self._browser
+        retired = [slot for slot in self._slots if slot is not None]
+        for slot in retired:
+            slot["retired"] = True
+        await self._launch_browser()
+        for slot in retired:
+            if slot["active"] == 0:
+                await self._close_context(slot)
+        if not self._open_contexts.get(old):
+            self._open_contexts.pop(old, None)
+            await self._close_browser(old)
+
+    async def _acquire_slot(self):
+        async with self._lock:
+            if not self._browser.is_connected():
+                print("Browser disconnected, relaunching...")
+                self._open_contexts.pop(self._browser, None)
+                await self._launch_browser()
+
+            index = self._next_slot
+            self._next_slot = (self._next_slot + 1) % self.size
+            if self._slots[index] is None:
+                self._slots[index] = await self._new_slot()
+            slot = self._slots[index]
+
+            slot["pages"] += 1
+            slot["active"] += 1
+            if slot["pages"] >= self.max_pages_per_context:
+                # Retire the context: new pages go to a fresh one, and this
+                # one is closed once its last open page is released
+                slot["retired"] = True
+                self._slots[index] = None
+            return slot
+
+    async def _release_slot(self, slot, crashed):
+        async with self._lock:
+            slot["active"] -= 1
+            if crashed and not slot["retired"]:
+                print("Page crashed, recycling browser context")
+                slot["retired"] = True
+                if slot in self._slots:
+                    self._slots[self._slots.index(slot)] = None
+            if slot["retired"] and slot["active"] == 0:
+                await self._close_context(slot, crashed)
+            elif self.session and not crashed:
+                await self.session.save_async(slot["context"])
+
+            reason = self.memory.page_done() if self.memory else None
+            if reason and slot["browser"] is self._browser:
+                await self._recycle_browser(reason)
+
+    @asynccontextmanager
+    async def page(self):
+        """Borrow a fresh page from one of the pooled contexts"""
+        slot = await self._acquire_slot()
+        crashed = []
+        page = await slot["context"].new_page()
+        page.on("crash", lambda _: crashed.append(True))
+        # Route handlers run newest first: the blocker, then the cache
+        if self.asset_cache:
+            await self.asset_cache.attach_async(page)
+        stats = await self.blocker.attach_async(page) if self.blocker else None
+        try:
+            yield page
+        finally:
+            try:
+                await page.close()
+            except PlaywrightError:
+                crashed.append(True)
+            if stats:
+                self.blocker.finish(stats)
+            await self._release_slot(slot, bool(crashed))
+
+
+async def is_security_check(page):
+    """Detect CAPTCHA or security check pages"""
+    return bool(
+        await page.query_selector("div[class*='captcha']")
+        or await page.query_selector("div[class*='security-check']")
+    )
+
+
+async def check_page(page, response, security_check, url, screenshot):
+    """Raise the classified error for a CAPTCHA page or a non-200 response"""
+    if security_check:
+        print("Warning: Detected possible CAPTCHA or security check page")
+        await page.screenshot(path=screenshot)
+        raise BlockedError(f"Security check or CAPTCHA detected on {url}")
+    raise_for_status(response.status if response else None, url)
+
+
+async def scrape_listing_page(page, url, budget):
+    """Returns the job links of one search results page"""
+    response, security_check = await budget.navigate(page, url)
+    await check_page(page, response, security_check, url, "captcha_screenshot.png")
+
+    with get_metrics().span("wait.listing"):
+        await page.wait_for_selector(".air3-link", timeout=60000)
+
+    return (await extract_async(page, LISTING))["links"]
+
+
+async def iter_parent_job_links(
+    pool, budget, per_page=10, max_pages=5, stop_at=None, params=None
+):
+    """Yields job listing links page by page; see parent_jobs.iter_parent_job_links"""
+    for page_number in range(1, max_pages + 1):
+        url = search_url(page_number, per_page, params)
+
+        async def load(attempt):
+            async with budget.slot(url), pool.page() as page:
+                with get_metrics().span("discovery.page"):
+                    return await scrape_listing_page(page, url, budget)
+
+        links = await RetryPolicy.from_env().call_async(load, "listing")
+
+        print(f"Found {len(links)} jobs on page {page_number}")
+        for link in links:
+            if not link:
+                continue
+            if stop_at and stop_at(link):
+                print(f"Reached already scraped job {link}, stopping discovery")
+                return
+            yield link
+
+        if len(links) < per_page:
+            return
+
+
+async def get_parent_job_details(page, url):
+    """Read the main job details from the page in one evaluate call"""
+    return (await extract_async(page, PARENT_JOB)).require(url)
+
+
+async def find_in_progress_links(page, max_retries=3):
+    """Find in-progress job links with retries on a page with an in-progress section"""
+
+    async def expand(attempt):
+        in_progress_button = await page.query_selector(IN_PROGRESS_SECTION)
+        if not in_progress_button:
+            raise TransientError("In-progress button disappeared")
+        links = await expand_in_progress_async(page, in_progress_button)
+        if links:
+            return links
+
+        hrefs = (await extract_async(page, IN_PROGRESS_LIST))["links"]
+        # A dict keeps the page order while dropping repeated links
+        in_progress_links = dict.fromkeys(hrefs)
+        in_progress_links.pop(None, None)
+        if not in_progress_links:
+            raise TransientError("In-progress section has no links yet")
+        return list(in_progress_links)
+
+    try:
+        return await RetryPolicy.from_env(max_retries).call_async(
+            expand, "find_in_progress_links"
+        )
+    except Exception:
+        return []
+
+
+async def scrape_parent_job(link, pool, budget, max_retries=3):
+    """Scrapes a single parent job and its in-progress links with retries"""
+    url = absolute_url(link)
+    fetcher = get_http_fetcher()
+    if fetcher:
+        # http.client is blocking; keep it off the event loop
+        async with budget.slot(url):
+            job = await asyncio.to_thread(fetcher.fetch_parent_job, link)
+        if job:
+            return dict(
+                job,
+                url=url,
+                timestamp=datetime.now().isoformat(),
+                source="upwork.com",
+            )
+
+    async def load(attempt):
+        async with budget.slot(url), pool.page() as page:
+            response, security_check = await budget.navigate(page, url)
+            await check_page(
+                page,
+                response,
+                security_check,
+                url,
+                f"captcha_details_screenshot_{attempt}.png",
+            )
+
+            with get_metrics().span("wait.job_details"):
+                await page.wait_for_selector(JOB_TITLE, timeout=60000)
+            try:
+                with get_metrics().span("wait.description"):
+                    await page.wait_for_selector(JOB_DESCRIPTION, timeout=30000)
+            except PlaywrightTimeoutError:
+                # A parent without a description would be lost for good
+                raise TransientError(f"Description not rendered on {url}")
+            details = await get_parent_job_details(page, url)
+            in_progress_links = []
+            if details["has_in_progress"]:
+                with get_metrics().span("find_in_progress_links"):
+                    in_progress_links = await find_in_progress_links(page)
+
+            return {
+                "url": url,
+                "title": details["title"],
+                "description": details["description"],
+                "location": job_location(details),
+                "timestamp": datetime.now().isoformat(),
+                "source": "upwork.com",
+                "in_progress_links": in_progress_links,
+            }
+
+    return await RetryPolicy.from_env(max_retries).call_async(load, "parent_job")
+
+
+async def scrape_in_progress_job(url, pool, budget, max_retries=3):
+    """Scrape details for a single in-progress job with retries"""
+    full_url = absolute_url(url)
+    fetcher = get_http_fetcher()
+    if fetcher:
+        async with budget.slot(full_url):
+            details = await asyncio.to_thread(fetcher.fetch_in_progress_job, url)
+        if details:
+            return details
+
+    async def load(attempt):
+        async with budget.slot(full_url), pool.page() as page:
+            response, security_check = await budget.navigate(page, full_url)
+            await check_page(
+                page,
+                response,
+                security_check,
+                full_url,
+                f"captcha_progress_screenshot_{attempt}.png",
+            )
+
+            details = details_from_document(await response.text() if response else None)
+            if details:
+                return details
+
+            with get_metrics().span("wait.job_details"):
+                await page.wait_for_selector(JOB_TITLE, timeout=30000)
+            try:
+                with get_metrics().span("wait.description"):
+                    await page.wait_for_selector(JOB_DESCRIPTION, timeout=30000)
+            except PlaywrightTimeoutError:
+                raise PermanentError(f"Description not found on {full_url}")
+            details = (await extract_async(page, IN_PROGRESS_JOB)).require(full_url)
+            return details["title"], details["description"]
+
+    return await RetryPolicy.from_env(max_retries).call_async(load, "in_progress_job")
+
+
+class AsyncScrapeEngine:
+    """Runs the parent-job and in-progress phases as concurrent asyncio tasks"""
+
+    def __init__(
+        self, cookies, store, frontier, discovery=None, concurrency=3, pool_size=2
+    ):
+        self.cookies = cookies
+        self.store = store
+        self.frontier = frontier
+        self.discovery = discovery or {}
+        self.concurrency = max(1, concurrency)
+        self.pool_size = pool_size
+        self.budget = PolitenessBudget(concurrency)
+        self._in_flight = {}
+
+    async def run(self):
+        """Scrape all pending frontier work into the result store"""
+        async with AsyncBrowserPool(
+            self.cookies,
+            size=self.pool_size,
+            blocker=ResourceBlocker.from_env(),
+            session=SessionStore.from_env(self.cookies),
+            asset_cache=AssetCache.from_env(),
+            memory=MemoryWatch.from_env(),
+        ) as pool:
+            queue = asyncio.Queue()
+            # In-progress jobs left over from a resumed run go first
+            for link, parent_url in self.frontier.pending(IN_PROGRESS):
+                queue.put_nowait((parent_url, link))
+
+            workers = [
+                asyncio.create_task(self._in_progress_worker(queue, pool))
+                for _ in range(self.concurrency)
+            ]
+            # Parent jobs left over from a resumed run, then newly discovered
+            # ones, each started as soon as its listing page has arrived
+            parents = [
+                asyncio.create_task(self._parent_task(link, pool, queue))
+                for link, _ in self.frontier.pending(PARENT)
+            ]
+            await self._discover(pool, queue, parents)
+
+            await asyncio.gather(*parents)
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+
+    async def _discover(self, pool, queue, parents):
+        """Search every pending query at once, the budget permitting.
+
+        A job found by several overlapping queries is scraped once.
+        """
+        options = dict(self.discovery)
+        queries = pending_queries(
+            self.frontier, options.pop("queries", None) or load_queries()
+        )
+        options.pop("parallel", None)
+        if not queries:
+            return
+        self.frontier.add(SEARCH, [query.url for query in queries])
+
+        seen = set()
+        options["stop_at"] = unseen_stop(options.get("stop_at"), seen)
+        await asyncio.gather(
+            *(
+                self._discover_query(query, options, seen, pool, queue, parents)
+                for query in queries
+            )
+        )
+        print(f"Found jobs: {len(seen)} from {len(queries)} queries")
+
+    async def _discover_query(self, query, options, seen, pool, queue, parents):
+        try:
+            async for link in iter_parent_job_links(
+                pool, self.budget, params=query.params, **options
+            ):
+                key = job_key(link)
+                if key in seen:
+                    get_metrics().incr("discovery.duplicates")
+                    continue
+                seen.add(key)
+                self.frontier.add(PARENT, [link])
+                if self.frontier.is_pending(PARENT, link):
+                    parents.append(
+                        asyncio.create_task(self._parent_task(link, pool, queue))
+                    )
+        except Exception as e:
+            self.frontier.mark_failed(SEARCH, query.url, error=e)
+            print(f"Error getting job links for query {query.name}: {e}")
+            return
+
+        self.frontier.mark_done(SEARCH, query.url)
+
+    async def _parent_task(self, link, pool, queue):
+        try:
+            with get_metrics().span("parent_job"):
+                job_data = await scrape_parent_job(link, pool, self.budget)
+        except Exception as e:
+            self.frontier.mark_failed(PARENT, link, error=e)
+            print(f"Error processing parent job {link}: {e}")
+            return
+
+        # Links skipped as recently scraped are not queued
+        pending = record_parent_job(link, job_data, self.store, self.frontier)
+        print(
+            f"Parent job done: {job_data['url']} "
+            f"({len(job_data['in_progress_links'])} in-progress links)"
+        )
+        for in_progress_link in pending:
+            await queue.put((job_data["url"], in_progress_link))
+
+    async def _fetch_details(self, link, pool):
+        """Fetch each job once, however many parents list it"""
+        cached = self.store.cached_details(link)
+        if cached:
+            get_metrics().incr("details_cache.hits")
+            return cached
+
+        key = job_key(link)
+        if key in self._in_flight:
+            return await asyncio.shield(self._in_flight[key])
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            with get_metrics().span("in_progress_job"):
+                details = await scrape_in_progress_job(link, pool, self.budget)
+            self.store.cache_details(link, *details)
+            future.set_result(details)
+            return details
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception retrieved when no other task was waiting
+            future.exception()
+            raise
+        finally:
+            del self._in_flight[key]
+
+    async def _in_progress_worker(self, queue, pool):
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+
+            parent_url, link = item
+            try:
+                title, description = await self._fetch_details(link, pool)
+                record_in_progress_job(
+                    parent_url, link, title, description, self.store, self.frontier
+                )
+            except Exception as e:
+                self.frontier.mark_failed(IN_PROGRESS, link, parent_url, e)
+                print(f"Error processing in-progress job {link}: {e}")
@@ -0,0 +1,203 @@
+import argparse
+import json
+import math
+import os
+import resource
+import sys
+import tempfile
+import time
+from mock_server import MockUpworkServer
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process and of its reaped children (Chromium)"""
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    unit = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return own / unit, children / unit
+
+
+def configure_environment(server, args, db_path):
+    """Point the scraper at the mock server with benchmark-friendly settings"""
+    os.environ.update(
+        {
+            "UPWORK_BASE_URL": server.url,
+            "UPWORK_DB_PATH": db_path,
+            "UPWORK_MASTER_TOKEN": "benchmark",
+            "UPWORK_FETCH_BACKEND": args.fetch_backend,
+            # Measure the scraper, not its politeness
+            "UPWORK_RATE": "1000",
+            "UPWORK_RATE_MAX": "1000",
+            "UPWORK_SLEEP_SCALE": str(args.sleep_scale),
+            "UPWORK_SEARCH_PAGE_SIZE": str(args.per_page),
+            "UPWORK_SEARCH_MAX_PAGES": str(math.ceil(args.jobs / args.per_page)),
+        }
+    )
+
+
+def run_benchmark(args):
+    """Scrape the mock site once and return the measurements"""
+    with tempfile.TemporaryDirectory() as workdir, MockUpworkServer(
+        jobs=args.jobs,
+        in_progress_per_job=args.in_progress,
+        latency=args.latency,
+        error_rate=args.error_rate,
+        captcha_rate=args.captcha_rate,
+        fixtures_dir=args.fixtures_dir,
+        seed=args.seed,
+    ) as server:
+        configure_environment(server, args, os.path.join(workdir, "benchmark.db"))
+        cwd = os.getcwd()
+        # Screenshots and the CSV export land in the temporary directory
+        os.chdir(workdir)
+
+        # The scraper reads UPWORK_BASE_URL at import time
+        import main
+        from frontier import Frontier
+        from http_fetch import configure_http_fetcher
+        from metrics import get_metrics
+        from result_store import ResultStore
+
+        started = time.monotonic()
+        try:
+            with ResultStore.from_env("benchmark") as store:
+                frontier = Frontier(store)
+                configure_http_fetcher(main.get_cookies())
+                if args.engine == "async":
+                    main.run_async_engine(store, frontier, args.concurrency)
+                elif args.detail_workers:
+                    main.run_sync_engine(store, frontier, args.detail_workers)
+                else:
+                    # The plain two-phase flow
+                    with main.BrowserPool.from_env(main.get_cookies()) as pool:
+                        main.scrape_parent_jobs(store, frontier, pool)
+                        main.process_in_progress_jobs(store, frontier, pool)
+                seconds = time.monotonic() - started
+                main.save_to_csv(store)
+                summary = frontier.summary()
+        finally:
+            os.chdir(cwd)
+
+        metrics = get_metrics().snapshot()
+        own_rss, browser_rss = peak_rss_mb()
+        done = sum(states.get("done", 0) for states in summary.values())
+        return {
+            "engine": args.engine,
+            "jobs": args.jobs,
+            "in_progress_per_job": args.in_progress,
+            "seconds": seconds,
+            "jobs_done": done,
+            "jobs_per_second": done / seconds if seconds else 0.0,
+            "frontier": summary,
+            "peak_rss_mb": own_rss,
+            "peak_browser_rss_mb": browser_rss,
+            "browser_launches": metrics["counters"].get("browser_launches", 0),
+            "server_requests": dict(server.requests),
+            "errors_injected": server.errors_served,
+            "captchas_injected": server.captchas_served,
+            "metrics": metrics,
+        }
+
+
+def compare(result, baseline, tolerance):
+    """Return regressions of result against a baseline run, as messages"""
+    regressions = []
+    if result["jobs_per_second"] < baseline["jobs_per_second"] * (1 - tolerance):
+        regressions.append(
+            f"throughput {result['jobs_per_second']:.2f} jobs/s is below "
+            f"baseline {baseline['jobs_per_second']:.2f} jobs/s"
+        )
+    for key in ("peak_rss_mb", "peak_browser_rss_mb"):
+        if result[key] > baseline[key] * (1 + tolerance):
+            regressions.append(
+                f"{key} {result[key]:.0f} MB is above baseline {baseline[key]:.0f} MB"
+            )
+    if result["browser_launches"] > baseline["browser_launches"]:
+        regressions.append(
+            f"{result['browser_launches']} browser launches, "
+            f"baseline had {baseline['browser_launches']}"
+        )
+    if result["jobs_done"] < baseline["jobs_done"]:
+        regressions.append(
+            f"{result['jobs_done']} jobs done, baseline had {baseline['jobs_done']}"
+        )
+    return regressions
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the scraper against a local mock Upwork server"
+    )
+    parser.add_argument("--jobs", type=int, default=25)
+    parser.add_argument("--per-page", type=int, default=10)
+    parser.add_argument("--in-progress", type=int, default=3)
+    parser.add_argument(
+        "--latency", type=float, default=0.05, help="mean page latency in seconds"
+    )
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--captcha-rate", type=float, default=0.0)
+    parser.add_argument(
+        "--fixtures-dir", help="serve saved pages instead of generated ones"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--engine", choices=["sync", "async"], default="sync")
+    parser.add_argument("--concurrency", type=int, default=3)
+    parser.add_argument(
+        "--detail-workers",
+        type=int,
+        default=0,
+        help="sync engine detail threads (0 runs scrape_parent_jobs, then "
+        "process_in_progress_jobs)",
+    )
+    parser.add_argument(
+        "--fetch-backend", choices=["browser", "http"], default="browser"
+    )
+    parser.add_argument(
+        "--sleep-scale",
+        type=float,
+        default=0.01,
+        help="multiplier for the scraper's deliberate sleeps",
+    )
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="allowed relative regression against the baseline",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    result = run_benchmark(args)
+
+    print(
+        f"\nBenchmark ({result['engine']} engine): {result['jobs_done']} jobs in "
+        f"{result['seconds']:.1f}s, {result['jobs_per_second']:.2f} jobs/s"
+    )
+    print(
+        f"Peak RSS: {result['peak_rss_mb']:.0f} MB scraper, "
+        f"{result['peak_browser_rss_mb']:.0f} MB largest browser process"
+    )
+    print(f"Browser launches: {result['browser_launches']}")
+    print(
+        f"Server: {result['server_requests']}, {result['errors_injected']} errors "
+        f"and {result['captchas_injected']} CAPTCHAs injected"
+    )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+        print(f"Results saved to file: {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(result, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        if regressions:
+            sys.exit(1)
+        print("No regressions against the baseline")
@@ -0,0 +1,254 @@
+from contextlib import contextmanager
+import os
+import time
+from playwright.sync_api import sync_playwright, Error as PlaywrightError
+from memory_watch import MemoryWatch, launch_tracked, start_tracked
+from resource_blocking import ResourceBlocker
+from session_cache import AssetCache, SessionStore
+from metrics import get_metrics
+from rate_limiter import get_rate_limiter
+from retry import BlockedError, raise_for_status
+
+LAUNCH_ARGS = [
+    "--disable-blink-features=AutomationControlled",
+    "--no-sandbox",
+    "--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+]
+
+
+class BrowserPool:
+    """Long-lived Chromium instance with a small pool of reusable contexts.
+
+    With a session store, contexts start from the saved storage state
+    instead of the bare env cookies. With an asset cache, static assets are
+    read from disk rather than downloaded again by every new context. With
+    a memory watch, the whole browser is relaunched once it exceeds its
+    memory or page budget.
+    """
+
+    def __init__(
+        self,
+        cookies=None,
+        size=1,
+        max_pages_per_context=50,
+        headless=True,
+        blocker=None,
+        session=None,
+        asset_cache=None,
+        memory=None,
+    ):
+        self.cookies = cookies
+        self.size = max(1, size)
+        self.max_pages_per_context = max(1, max_pages_per_context)
+        self.headless = headless
+        self.blocker = blocker
+        self.session = session
+        self.asset_cache = asset_cache
+        self.memory = memory
+        self.browser_launches = 0
+        self._playwright = None
+        self._driver_pid = None
+        self._browser = None
+        self._slots = []
+        self._next_slot = 0
+
+    @classmethod
+    def from_env(cls, cookies=None):
+        """Create a pool configured from UPWORK_POOL_* environment variables"""
+        return cls(
+            cookies=cookies,
+            size=int(os.getenv("UPWORK_POOL_SIZE", "2")),
+            max_pages_per_context=int(os.getenv("UPWORK_POOL_MAX_PAGES", "50")),
+            blocker=ResourceBlocker.from_env(),
+            session=SessionStore.from_env(cookies),
+            asset_cache=AssetCache.from_env(),
+            memory=MemoryWatch.from_env(),
+        )
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def start(self):
+        """Start Playwright and launch the shared browser"""
+        if self._playwright is None:
+            self._playwright, self._driver_pid = start_tracked(
+                lambda: sync_playwright().start()
+            )
+        if self._browser is None:
+            self._launch_browser()
+        return self
+
+    def close(self):
+        """Close all contexts, the browser and Playwright itself"""
+        for index in range(len(self._slots)):
+            self._close_slot(index)
+        if self._browser is not None:
+            try:
+                self._browser.close()
+            except PlaywrightError:
+                pass
+            self._browser = None
+        if self._playwright is not None:
+            self._playwright.stop()
+            self._playwright = None
+            self._driver_pid = None
+        if self.blocker:
+            self.blocker.report()
+        if self.asset_cache:
+            self.asset_cache.report()
+        if self.memory:
+            self.memory.report()
+
+    def _launch_browser(self):
+        print("Launching browser...")
+        self._browser, pid = launch_tracked(
+            lambda: self._playwright.chromium.launch(
+                headless=self.headless, args=LAUNCH_ARGS
+            ),
+            self._driver_pid,
+        )
+        if self.memory:
+            self.memory.launched(pid)
+        self.browser_launches += 1
+        get_metrics().incr("browser_launches")
+        self._slots = [None] * self.size
+
+    def _relaunch_browser(self):
+        for index in range(len(self._slots)):
+            self._close_slot(index)
+        if self._browser is not None:
+            try:
+                self._browser.close()
+            except PlaywrightError:
+                pass
+        self._launch_browser()
+
+    def _new_slot(self):
+        if not self.session:
+            context = self._browser.new_context()
+            if self.cookies:
+                context.add_cookies(self.cookies)
+            return {"context": context, "pages": 0}
+
+        options = self.session.context_options()
+        context = self._browser.new_context(**options)
+        missing = self.session.missing_cookies(options.get("storage_state"))
+        if missing:
+            context.add_cookies(missing)
+        return {"context": context, "pages": 0}
+
+    def _close_slot(self, index, crashed=False):
+        slot = self._slots[index]
+        self._slots[index] = None
+        if slot is not None:
+            if self.session and not crashed:
+                self.session.save(slot["context"], force=True)
+            try:
+                slot["context"].close()
+            except PlaywrightError:
+                pass
+
+    @contextmanager
+    def page(self):
+        """Borrow a fresh page from one of the pooled contexts.
+
+        The context is recycled once it has served max_pages_per_context
+        pages or after its page crashed; a disconnected browser is relaunched.
+        With a blocker configured, unneeded resources are never downloaded.
+        """
+        self.start()
+        if not self._browser.is_connected():
+            print("Browser disconnected, relaunching...")
+            self._relaunch_browser()
+
+        index = self._next_slot
+        self._next_slot = (self._next_slot + 1) % self.size
+        if self._slots[index] is None:
+            self._slots[index] = self._new_slot()
+        slot = self._slots[index]
+
+        crashed = []
+        page = slot["context"].new_page()
+        page.on("crash", lambda _: crashed.append(True))
+        # Route handlers run newest first: the blocker, then the cache
+        if self.asset_cache:
+            self.asset_cache.attach(page)
+        stats = self.blocker.attach(page) if self.blocker else None
+        try:
+            yield page
+        finally:
+            slot["pages"] += 1
+            try:
+                page.close()
+            except PlaywrightError:
+                crashed.append(True)
+            if stats:
+                self.blocker.finish(stats)
+
+            if crashed:
+                print("Page crashed, recycling browser context")
+                self._close_slot(index, crashed=True)
+                if not self._browser.is_connected():
+                    self._relaunch_browser()
+            elif slot["pages"] >= self.max_pages_per_context:
+                self._close_slot(index)
+            elif self.session:
+                # Pick up cookies the site has rotated meanwhile
+                self.session.save(slot["context"])
+
+            reason = self.memory.page_done() if self.memory else None
+            if reason and self._browser.is_connected():
+                self.memory.recycling(reason)
+                self._relaunch_browser()
+
+
+@contextmanager
+def use_pool(pool=None, cookies=None):
+    """Yield the given pool, or a temporary one that is closed afterwards"""
+    if pool is not None:
+        yield pool
+        return
+
+    with BrowserPool(cookies=cookies) as temporary_pool:
+        yield temporary_pool
+
+
+def is_security_check(page):
+    """Detect CAPTCHA or security check pages"""
+    return bool(
+        page.query_selector("div[class*='captcha']")
+        or page.query_selector("div[class*='security-check']")
+    )
+
+
+def navigate(page, url):
+    """Open url once the shared rate limiter allows it.
+
+    The response status, latency and CAPTCHA detection are fed back into the
+    limiter. Returns (response, security_check_detected).
+    """
+    limiter = get_rate_limiter()
+    limiter.wait()
+    started = time.monotonic()
+    with get_metrics().span("page.goto"):
+        response = page.goto(url)
+    security_check = is_security_check(page)
+    limiter.record(
+        response.status if response else None,
+        time.monotonic() - started,
+        captcha=security_check,
+    )
+    return response, security_check
+
+
+def check_page(page, response, security_check, url, screenshot):
+    """Raise the classified error for a CAPTCHA page or a non-200 response"""
+    if security_check:
+        print("Warning: Detected possible CAPTCHA or security check page")
+        page.screenshot(path=screenshot)
+        print(f"Screenshot saved as {screenshot}")
+        raise BlockedError(f"Security check or CAPTCHA detected on {url}")
+    raise_for_status(response.status if response else None, url)
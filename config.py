@@ -0,0 +1,44 @@
+import ipaddress
+import os
+import re
+from urllib.parse import urlparse
+from dotenv import load_dotenv
+
+# Load environment variables from .env file before any module reads them
+load_dotenv()
+
+# Site root; point it at a local server to run against saved pages
+BASE_URL = os.getenv("UPWORK_BASE_URL", "https://www.upwork.com").rstrip("/")
+
+
+def absolute_url(link):
+    """Turn a site-relative job link into an absolute URL"""
+    if link.startswith("http://") or link.startswith("https://"):
+        return link
+    return f"{BASE_URL}{link}"
+
+
+def job_key(link):
+    """Normalized job URL, the same however the job is linked.
+
+    Job links carry an optional title slug and tracking parameters
+    (/jobs/Some-Title_~01abc/?referrer=...); the ~id identifies the job.
+    """
+    path = urlparse(absolute_url(link)).path.rstrip("/")
+    match = re.search(r"~[0-9A-Za-z]+$", path)
+    if match:
+        return f"/jobs/{match.group(0).lower()}"
+    return path.lower()
+
+
+def cookie_domain():
+    """Cookie domain for BASE_URL (.upwork.com for the live site)"""
+    host = urlparse(BASE_URL).hostname
+    try:
+        ipaddress.ip_address(host)
+        return host
+    except ValueError:
+        pass
+    if host == "localhost":
+        return host
+    return "." + host.removeprefix("www.")
@@ -0,0 +1,398 @@
+import argparse
+import multiprocessing
+import os
+import queue
+import socket
+import threading
+import time
+from multiprocessing.managers import BaseManager
+from accounts import load_accounts
+from browser_pool import BrowserPool
+from config import job_key
+from frontier import PARENT, IN_PROGRESS
+from http_fetch import configure_http_fetcher
+from in_progress_jobs import scrape_in_progress_job
+from metrics import get_metrics
+from parent_jobs import scrape_parent_job
+from pipeline import record_parent_job, record_in_progress_job
+from rate_limiter import get_rate_limiter
+from retry import ScrapeError
+from search_queries import discover_links
+
+# Messages workers send back besides scrape results
+READY = "ready"
+SHARD_DONE = "shard_done"
+EXITED = "exited"
+
+
+class QueueManager(BaseManager):
+    """Serves the coordinator's task and result queues to remote workers"""
+
+
+class QueueClient(BaseManager):
+    """Worker-side connection to a QueueManager"""
+
+
+QueueClient.register("tasks")
+QueueClient.register("results")
+
+
+def parse_address(address):
+    """Split "host:port" into a (host, port) tuple"""
+    host, _, port = address.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+def connect_queues(address, authkey):
+    """Return (tasks, results) proxies for a coordinator serving at address"""
+    manager = QueueClient(address=parse_address(address), authkey=authkey)
+    manager.connect()
+    return manager.tasks(), manager.results()
+
+
+def _scrape(kind, item, cookies, pool):
+    """Scrape one shard item; returns (kind, url, parent_url, result, error)"""
+    if kind == PARENT:
+        link, parent_url = item, ""
+    else:
+        link, parent_url = item
+    try:
+        if kind == PARENT:
+            result = scrape_parent_job(link, cookies, pool=pool)
+        else:
+            result = scrape_in_progress_job(link, cookies, pool)
+        return kind, link, parent_url, result, None
+    except Exception as e:
+        print(f"Error processing {kind} job {link}: {e}")
+        # Classified errors pickle fine and keep their kind for the frontier
+        error = e if isinstance(e, ScrapeError) else str(e)
+        return kind, link, parent_url, None, error
+
+
+def run_worker(
+    name,
+    cookies,
+    tasks=None,
+    results=None,
+    fetch_backend=None,
+    connect=None,
+    rate_share=1,
+):
+    """Scrape shards from the task queue until a None sentinel arrives.
+
+    A worker either gets the queues directly (local processes) or connects
+    to a serving coordinator with connect=(address, authkey). rate_share is
+    the number of workers using the same account, which split its rate.
+    """
+    if connect:
+        tasks, results = connect_queues(*connect)
+
+    limiter = get_rate_limiter()
+    if rate_share > 1:
+        limiter.rate /= rate_share
+        limiter.min_rate /= rate_share
+        limiter.max_rate /= rate_share
+    configure_http_fetcher(cookies, fetch_backend)
+
+    results.put((READY, name))
+    try:
+        with BrowserPool.from_env(cookies) as pool:
+            while True:
+                shard = tasks.get()
+                if shard is None:
+                    return
+                shard_id, kind, items = shard
+                print(f"[{name}] Shard {shard_id}: {len(items)} {kind} jobs")
+                for item in items:
+                    stage = "parent_job" if kind == PARENT else "in_progress_job"
+                    with get_metrics().span(stage):
+                        result = _scrape(kind, item, cookies, pool)
+                    results.put(result)
+                results.put((SHARD_DONE, shard_id))
+    finally:
+        limiter.report()
+        # The coordinator folds every worker's timings into the run's metrics
+        results.put((EXITED, name, get_metrics().snapshot()))
+
+
+class ShardCoordinator:
+    """Splits the frontier into shards and farms them out to worker processes.
+
+    The coordinator discovers parent jobs itself and batches pending work
+    into shards of shard_size jobs on a shared task queue, so idle workers
+    pick up the next shard. Each worker runs its own browser pool with the
+    cookies of one account; accounts are assigned round-robin. Workers send
+    scraped data back and the coordinator is the only process writing to
+    the result store, so every worker's results end up in one output.
+
+    With serve_address set, the queues are also served over TCP so workers
+    started elsewhere with `python coordinator.py --connect` can join in.
+    Remote workers may join at any time, so the coordinator then keeps
+    waiting for them until every shard is done. It stops earlier on Ctrl-C,
+    or after worker_timeout seconds without any worker (0 waits forever).
+    """
+
+    def __init__(
+        self,
+        store,
+        frontier,
+        accounts,
+        processes=2,
+        shard_size=5,
+        fetch_backend=None,
+        serve_address=None,
+        authkey=None,
+        worker_timeout=0.0,
+    ):
+        self.store = store
+        self.frontier = frontier
+        self.accounts = accounts
+        self.processes = processes
+        self.shard_size = max(1, shard_size)
+        self.fetch_backend = fetch_backend
+        self.serve_address = serve_address
+        self.authkey = authkey
+        self.worker_timeout = worker_timeout
+        self.outstanding = 0
+        self.workers = set()
+        self.exited = set()
+        self._shard_ids = 0
+        self._processes = []
+        self._local_names = set()
+        self._parents = []
+        self._waiting = {}
+
+    def run(self, discovery=None):
+        """Scrape leftover and newly discovered jobs until every shard is done"""
+        self._tasks, self._results = self._queues()
+        self._start_workers()
+        try:
+            # Work left over from a resumed run goes out first
+            self._enqueue_in_progress(self.frontier.pending(IN_PROGRESS))
+            self._enqueue(PARENT, [url for url, _ in self.frontier.pending(PARENT)])
+            self._discover(discovery or {})
+            self._wait()
+        finally:
+            self._stop_workers()
+
+    def _queues(self):
+        if not self.serve_address:
+            context = multiprocessing.get_context("spawn")
+            return context.Queue(), context.Queue()
+
+        if not self.authkey:
+            raise ValueError("Set UPWORK_COORDINATOR_AUTHKEY to serve remote workers")
+        tasks, results = queue.Queue(), queue.Queue()
+        QueueManager.register("tasks", callable=lambda: tasks)
+        QueueManager.register("results", callable=lambda: results)
+        manager = QueueManager(
+            address=parse_address(self.serve_address), authkey=self.authkey
+        )
+        server = manager.get_server()
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        print(f"Serving work queues on {self.serve_address}")
+        return tasks, results
+
+    def _start_workers(self):
+        context = multiprocessing.get_context("spawn")
+        assigned = [
+            self.accounts[i % len(self.accounts)] for i in range(self.processes)
+        ]
+        for i, (account, cookies) in enumerate(assigned):
+            name = f"{account}-{i + 1}"
+            self._local_names.add(name)
+            # Local workers sharing an account share its request rate
+            rate_share = sum(1 for other, _ in assigned if other == account)
+            kwargs = {"fetch_backend": self.fetch_backend, "rate_share": rate_share}
+            if self.serve_address:
+                kwargs["connect"] = (self.serve_address, self.authkey)
+            else:
+                kwargs.update(tasks=self._tasks, results=self._results)
+            process = context.Process(
+                target=run_worker,
+                args=(name, cookies),
+                kwargs=kwargs,
+                name=f"scrape-worker-{i + 1}",
+            )
+            process.start()
+            self._processes.append(process)
+        print(f"Started {self.processes} worker processes")
+
+    def _enqueue(self, kind, items):
+        items = list(items)
+        for start in range(0, len(items), self.shard_size):
+            self._shard_ids += 1
+            self.outstanding += 1
+            self._tasks.put(
+                (self._shard_ids, kind, items[start : start + self.shard_size])
+            )
+
+    def _discover(self, discovery):
+        """Stream job discovery, sending parent jobs out a shard at a time"""
+        cookies = self.accounts[0][1]
+        found = 0
+        for link in discover_links(self.frontier, cookies, **discovery):
+            found += 1
+            self.frontier.add(PARENT, [link])
+            if self.frontier.is_pending(PARENT, link):
+                self._parents.append(link)
+            if len(self._parents) >= self.shard_size:
+                self._enqueue(PARENT, self._parents)
+                self._parents = []
+            self._drain()
+        if not found:
+            print("No new job links found")
+        self._enqueue(PARENT, self._parents)
+        self._parents = []
+
+    def _drain(self):
+        """Record every result that has arrived so far without waiting"""
+        while True:
+            try:
+                self._handle(self._results.get_nowait())
+            except queue.Empty:
+                return
+
+    def _wait(self):
+        """Record results until all shards are done or no worker is left"""
+        if self.outstanding:
+            print(f"\nWaiting for {self.outstanding} shards...")
+        idle_since = None
+        while self.outstanding:
+            try:
+                self._handle(self._results.get(timeout=5))
+            except queue.Empty:
+                local_alive = any(process.is_alive() for process in self._processes)
+                remote_alive = self.workers - self.exited - self._local_names
+                if local_alive or remote_alive:
+                    idle_since = None
+                    continue
+                if not self.serve_address:
+                    print(
+                        f"All workers stopped with {self.outstanding} shards left; "
+                        "they stay pending for --resume"
+                    )
+                    return
+
+                # No worker has connected yet, or all of them left; more may join
+                if idle_since is None:
+                    idle_since = time.monotonic()
+                    print(
+                        f"No workers connected, {self.outstanding} shards queued; "
+                        "waiting for workers to join (Ctrl-C to stop)"
+                    )
+                elif (
+                    self.worker_timeout
+                    and time.monotonic() - idle_since >= self.worker_timeout
+                ):
+                    print(
+                        f"No worker joined for {self.worker_timeout:.0f}s with "
+                        f"{self.outstanding} shards left; they stay pending for --resume"
+                    )
+                    return
+
+    def _handle(self, message):
+        kind = message[0]
+        if kind == READY:
+            self.workers.add(message[1])
+            print(f"Worker {message[1]} is ready")
+        elif kind == EXITED:
+            self.exited.add(message[1])
+            get_metrics().merge(message[2])
+        elif kind == SHARD_DONE:
+            self.outstanding -= 1
+        else:
+            _, link, parent_url, result, error = message
+            self._record(kind, link, parent_url, result, error)
+
+    def _enqueue_in_progress(self, entries):
+        """Send each in-progress job out once, however many parents list it"""
+        new = []
+        for link, parent_url in entries:
+            cached = self.store.cached_details(link)
+            if cached:
+                get_metrics().incr("details_cache.hits")
+                record_in_progress_job(
+                    parent_url, link, *cached, self.store, self.frontier
+                )
+                continue
+            key = job_key(link)
+            if key in self._waiting:
+                self._waiting[key].append((link, parent_url))
+            else:
+                self._waiting[key] = [(link, parent_url)]
+                new.append((link, parent_url))
+        self._enqueue(IN_PROGRESS, new)
+
+    def _record(self, kind, link, parent_url, result, error):
+        if kind == PARENT:
+            entries = [(link, parent_url)]
+        else:
+            # Fan the result out to every parent waiting for this job
+            entries = self._waiting.pop(job_key(link), [(link, parent_url)])
+        try:
+            if error:
+                for link, parent_url in entries:
+                    self.frontier.mark_failed(kind, link, parent_url, error)
+            elif kind == PARENT:
+                pending = record_parent_job(link, result, self.store, self.frontier)
+                self._enqueue_in_progress(
+                    [(in_progress, result["url"]) for in_progress in pending]
+                )
+            else:
+                self.store.cache_details(link, *result)
+                for link, parent_url in entries:
+                    record_in_progress_job(
+                        parent_url, link, *result, self.store, self.frontier
+                    )
+        except Exception as e:
+            self.frontier.mark_failed(kind, link, parent_url, e)
+            print(f"Error recording {kind} job {link}: {e}")
+
+    def _stop_workers(self):
+        remote = self.workers - self._local_names - self.exited
+        for _ in range(len(self._processes) + len(remote)):
+            self._tasks.put(None)
+        for process in self._processes:
+            process.join(timeout=60)
+            if process.is_alive():
+                process.terminate()
+        self._drain()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Run a scrape worker for a coordinator started with --serve"
+    )
+    parser.add_argument(
+        "--connect",
+        default=os.getenv("UPWORK_COORDINATOR_ADDRESS"),
+        required=not os.getenv("UPWORK_COORDINATOR_ADDRESS"),
+        help="host:port the coordinator serves its queues on",
+    )
+    parser.add_argument(
+        "--account",
+        help="name of the account to use from the accounts file (default: first)",
+    )
+    parser.add_argument(
+        "--fetch-backend",
+        choices=["browser", "http"],
+        default=os.getenv("UPWORK_FETCH_BACKEND", "browser"),
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    accounts = dict(load_accounts())
+    account = args.account or next(iter(accounts))
+    authkey = os.getenv("UPWORK_COORDINATOR_AUTHKEY", "").encode()
+    try:
+        run_worker(
+            f"{account}@{socket.gethostname()}-{os.getpid()}",
+            accounts[account],
+            fetch_backend=args.fetch_backend,
+            connect=(args.connect, authkey),
+        )
+    except KeyboardInterrupt:
+        print("\nWorker interrupted by user")
@@ -0,0 +1,344 @@
+import hashlib
+import json
+import math
+import multiprocessing
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from metrics import get_metrics
+
+# Bump when the features change, so cached results are computed again
+VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS enrichment_cache (
+    content_hash TEXT PRIMARY KEY,
+    features TEXT NOT NULL,
+    enriched_at REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS job_enrichment (
+    url TEXT PRIMARY KEY,
+    run_id TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    budget_type TEXT,
+    budget_min REAL,
+    budget_max REAL,
+    country TEXT,
+    city TEXT,
+    language TEXT,
+    relevance REAL,
+    matched_keywords TEXT
+);
+CREATE INDEX IF NOT EXISTS job_enrichment_run_id ON job_enrichment (run_id);
+"""
+
+AMOUNT = r"\$\s?(\d[\d,]*(?:\.\d+)?)\s?(k)?"
+RANGE = rf"{AMOUNT}(?:\s*(?:-|–|to)\s*(?:\$\s?)?(\d[\d,]*(?:\.\d+)?)\s?(k)?)?"
+HOURLY_BUDGET = re.compile(
+    rf"{RANGE}\s*(?:/\s?(?:hr|hour|h)\b|per hour|an hour|hourly)", re.IGNORECASE
+)
+BUDGET = re.compile(RANGE, re.IGNORECASE)
+
+# The local time Upwork shows next to the client's city
+LOCAL_TIME = re.compile(r"\b\d{1,2}:\d{2}\s*(?:[AP]M)?\b", re.IGNORECASE)
+
+WORD = re.compile(r"[^\W\d_]+(?:['’][^\W\d_]+)?")
+
+STOPWORDS = {
+    "en": "the and to of a in is for with you we our are this that be on will have",
+    "de": "der die und das ist nicht mit ein eine wir sie für auf den zu von",
+    "fr": "le la les et des est pour une dans nous vous avec sur pas que du",
+    "es": "el la los las y es para una con que por del se en nuestro buscamos",
+    "it": "il la di e che per una con sono del della non siamo cerchiamo gli",
+    "pt": "o a os as e de para uma com que não do da em estamos procuramos",
+    "nl": "de het een en van is voor met wij op niet dat zijn te naar",
+    "pl": "i w na z do się nie jest że to dla oraz szukamy jak od",
+}
+STOPWORDS = {language: set(words.split()) for language, words in STOPWORDS.items()}
+
+
+def _amount(number, thousands):
+    value = float(number.replace(",", ""))
+    return value * 1000 if thousands else value
+
+
+def parse_budget(text):
+    """(type, min, max) of the first budget in text, or (None, None, None).
+
+    Amounts followed by /hr, per hour or hourly are an hourly rate; any
+    other dollar amount or range is a fixed price.
+    """
+    if not text:
+        return None, None, None
+    for budget_type, pattern in (("hourly", HOURLY_BUDGET), ("fixed", BUDGET)):
+        match = pattern.search(text)
+        if match:
+            low = _amount(match.group(1), match.group(2))
+            high = _amount(match.group(3), match.group(4)) if match.group(3) else low
+            return budget_type, min(low, high), max(low, high)
+    return None, None, None
+
+
+def clean_location(location):
+    """Split a 'Country + details' location into (country, city)"""
+    if not location:
+        return None, None
+    country, _, details = location.partition(" + ")
+    city = " ".join(LOCAL_TIME.sub(" ", details).split()).strip(" ,")
+    return country.strip() or None, city or None
+
+
+def tokenize(text):
+    return [word.lower() for word in WORD.findall(text or "")]
+
+
+def detect_language(tokens):
+    """Language code with the most stopwords among the tokens, or None"""
+    scores = {
+        language: sum(1 for token in tokens if token in words)
+        for language, words in STOPWORDS.items()
+    }
+    language, hits = max(scores.items(), key=lambda item: item[1])
+    # Short or mixed texts do not say much
+    if hits < 3 or hits < 0.05 * len(tokens):
+        return None
+    return language
+
+
+def keyword_counts(tokens, keywords):
+    """{keyword: occurrences} for single words and multi-word phrases"""
+    counts = {}
+    for keyword in keywords:
+        phrase = tokenize(keyword)
+        if not phrase:
+            continue
+        n = len(phrase)
+        found = sum(
+            1 for i in range(len(tokens) - n + 1) if tokens[i : i + n] == phrase
+        )
+        if found:
+            counts[keyword] = found
+    return counts
+
+
+def content_hash(item, keywords):
+    """Hash of everything the features of item depend on"""
+    data = [VERSION, item["title"], item["description"], item["location"], keywords]
+    return hashlib.sha256(json.dumps(data).encode()).hexdigest()
+
+
+def content_features(item, keywords):
+    """Features that only depend on one job's own text"""
+    text = f"{item['title'] or ''}\n{item['description'] or ''}"
+    tokens = tokenize(text)
+    budget_type, budget_min, budget_max = parse_budget(text)
+    country, city = clean_location(item["location"])
+    return {
+        "budget_type": budget_type,
+        "budget_min": budget_min,
+        "budget_max": budget_max,
+        "country": country,
+        "city": city,
+        "language": detect_language(tokens),
+        "tokens": len(tokens),
+        "keyword_counts": keyword_counts(tokens, keywords),
+    }
+
+
+def enrich_batch(items, keywords):
+    """content_features() of a batch of jobs; runs in the worker processes"""
+    return [(item["hash"], content_features(item, keywords)) for item in items]
+
+
+def relevance_scores(features, keywords):
+    """TF-IDF relevance of every job of a batch to the keywords.
+
+    A score is the IDF-weighted number of keyword occurrences per 100 words
+    of the job's text. The IDF of each keyword comes from the whole batch,
+    so a keyword found in every description counts for less than a rare
+    one. The scores are computed from the cached keyword counts in one
+    pass, which makes them cheap to redo for every run even when no text
+    changed.
+    """
+    if not keywords or not features:
+        return [None] * len(features)
+    total = len(features)
+    idf = {
+        keyword: math.log(
+            (1 + total)
+            / (1 + sum(1 for f in features if keyword in f["keyword_counts"]))
+        )
+        + 1
+        for keyword in keywords
+    }
+    return [
+        round(
+            sum(
+                count / max(1, f["tokens"]) * idf[keyword]
+                for keyword, count in f["keyword_counts"].items()
+                if keyword in idf
+            )
+            * 100,
+            4,
+        )
+        for f in features
+    ]
+
+
+class Enricher:
+    """Post-processing stage that adds parsed fields to a run's jobs.
+
+    Every parent and in-progress job of the run gets its budget parsed from
+    the text, its location split into country and city, its language
+    detected and a TF-IDF relevance score against the keywords. Results are
+    written to the job_enrichment table.
+
+    The text features are cached in enrichment_cache by a hash of the job's
+    content, so a re-run only processes jobs whose text changed. Those are
+    spread over a pool of worker processes in batches of batch_size.
+    """
+
+    def __init__(self, store, keywords=(), workers=None, batch_size=200):
+        self.store = store
+        self.keywords = list(keywords)
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.batch_size = max(1, batch_size)
+        with store.lock:
+            store.conn.executescript(SCHEMA)
+
+    @classmethod
+    def from_env(cls, store):
+        """Create an enricher from UPWORK_ENRICH_* and UPWORK_KEYWORDS variables"""
+        keywords = os.getenv("UPWORK_KEYWORDS", "")
+        workers = os.getenv("UPWORK_ENRICH_WORKERS")
+        return cls(
+            store,
+            keywords=[k.strip().lower() for k in keywords.split(",") if k.strip()],
+            workers=int(workers) if workers else None,
+            batch_size=int(os.getenv("UPWORK_ENRICH_BATCH", "200")),
+        )
+
+    def _items(self):
+        """Every job of the run with the fields enrichment needs, one per URL"""
+        items = {}
+        for job in self.store.iter_jobs():
+            items[job["url"]] = {
+                "url": job["url"],
+                "title": job["title"],
+                "description": job["description"],
+                "location": job["location"],
+            }
+            for child in job["in_progress"]:
+                if child["title"] or child["description"]:
+                    items.setdefault(child["url"], dict(child, location=None))
+        for item in items.values():
+            item["hash"] = content_hash(item, self.keywords)
+        return list(items.values())
+
+    def _cached(self, hashes):
+        cached = {}
+        conn = self.store.conn
+        hashes = list(hashes)
+        with self.store.lock:
+            # SQLite limits the number of parameters of one statement
+            for i in range(0, len(hashes), 500):
+                chunk = hashes[i : i + 500]
+                rows = conn.execute(
+                    "SELECT content_hash, features FROM enrichment_cache "
+                    f"WHERE content_hash IN ({', '.join('?' * len(chunk))})",
+                    chunk,
+                )
+                for row in rows:
+                    cached[row["content_hash"]] = json.loads(row["features"])
+        return cached
+
+    def _compute(self, items):
+        """{hash: features} of items, on the process pool when it is worth it"""
+        batches = [
+            items[i : i + self.batch_size]
+            for i in range(0, len(items), self.batch_size)
+        ]
+        if self.workers <= 1 or len(batches) == 1:
+            results = [enrich_batch(batch, self.keywords) for batch in batches]
+        else:
+            with ProcessPoolExecutor(
+                max_workers=min(self.workers, len(batches)),
+                mp_context=multiprocessing.get_context("spawn"),
+            ) as executor:
+                results = list(
+                    executor.map(enrich_batch, batches, [self.keywords] * len(batches))
+                )
+        return {key: features for batch in results for key, features in batch}
+
+    def _save(self, computed, items, features, scores):
+        now = time.time()
+        conn = self.store.conn
+        with self.store.lock:
+            with conn:
+                conn.executemany(
+                    """
+                    INSERT OR REPLACE INTO enrichment_cache
+                        (content_hash, features, enriched_at)
+                    VALUES (?, ?, ?)
+                    """,
+                    [(key, json.dumps(f), now) for key, f in computed.items()],
+                )
+                conn.executemany(
+                    """
+                    INSERT OR REPLACE INTO job_enrichment
+                        (url, run_id, content_hash, budget_type, budget_min,
+                         budget_max, country, city, language, relevance,
+                         matched_keywords)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    [
+                        (
+                            item["url"],
+                            self.store.run_id,
+                            item["hash"],
+                            f["budget_type"],
+                            f["budget_min"],
+                            f["budget_max"],
+                            f["country"],
+                            f["city"],
+                            f["language"],
+                            score,
+                            json.dumps(sorted(f["keyword_counts"])),
+                        )
+                        for item, f, score in zip(items, features, scores)
+                    ],
+                )
+
+    def run(self):
+        """Enrich every job of the store's current run; returns the number of jobs"""
+        started = time.monotonic()
+        metrics = get_metrics()
+        with metrics.span("enrichment"):
+            items = self._items()
+            if not items:
+                return 0
+            cached = self._cached({item["hash"] for item in items})
+            # Jobs with the same text are processed once
+            todo = {item["hash"]: item for item in items if item["hash"] not in cached}
+            computed = self._compute(list(todo.values())) if todo else {}
+            features = [
+                cached.get(item["hash"]) or computed[item["hash"]] for item in items
+            ]
+            scores = relevance_scores(features, self.keywords)
+            self._save(computed, items, features, scores)
+
+        hits = sum(1 for item in items if item["hash"] in cached)
+        metrics.incr("enrichment.cache_hits", hits)
+        metrics.incr("enrichment.processed", len(computed))
+        print(
+            f"\nEnriched {len(items)} jobs in {time.monotonic() - started:.1f}s "
+            f"({hits} from cache, {len(computed)} texts processed)"
+        )
+        if self.keywords:
+            ranked = sorted(zip(scores, items), key=lambda pair: -pair[0])
+            for score, item in ranked[:5]:
+                if score:
+                    print(f"  {score:7.2f}  {item['title']}  {item['url']}")
+        return len(items)
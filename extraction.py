@@ -0,0 +1,153 @@
+from metrics import get_metrics
+from retry import PermanentError
+
+JOB_TITLE = ".job-details-card .flex-1"
+JOB_DESCRIPTION = "p.text-body-sm"
+IN_PROGRESS_SECTION = ".jobs-in-progress-title"
+IN_PROGRESS_LINKS = ".air3-card-section:first-child .js-job-link"
+
+# Reads every field of a spec in one round trip to the browser
+EXTRACT_JS = """
+(fields) => {
+    const read = (el, attribute) => attribute ? el.getAttribute(attribute) : el.innerText;
+    const values = {};
+    for (const field of fields) {
+        if (field.exists) {
+            values[field.name] = document.querySelector(field.selector) !== null;
+        } else if (field.many) {
+            values[field.name] = Array.from(
+                document.querySelectorAll(field.selector), (el) => read(el, field.attribute)
+            );
+        } else {
+            const el = document.querySelector(field.selector);
+            values[field.name] = el ? read(el, field.attribute) : null;
+        }
+    }
+    return values;
+}
+"""
+
+
+class Field:
+    """One value read from a page.
+
+    By default, the innerText of the first element matching selector, or
+    its attribute when one is given. With many=True, the values of every
+    match. With exists=True, whether anything matches at all.
+    """
+
+    def __init__(
+        self, selector, attribute=None, many=False, exists=False, required=False
+    ):
+        self.selector = selector
+        self.attribute = attribute
+        self.many = many
+        self.exists = exists
+        self.required = required
+
+
+class PageSpec:
+    """The fields of one page type, read together in a single page.evaluate() call"""
+
+    def __init__(self, name, fields):
+        self.name = name
+        self.fields = fields
+
+    def arguments(self):
+        return [
+            {
+                "name": name,
+                "selector": field.selector,
+                "attribute": field.attribute,
+                "many": field.many,
+                "exists": field.exists,
+            }
+            for name, field in self.fields.items()
+        ]
+
+
+class MissingFieldsError(PermanentError):
+    """A rendered page lacks fields its spec requires"""
+
+    def __init__(self, spec, fields, url):
+        super().__init__(f"Missing {', '.join(fields)} on {spec.name} page {url}")
+        self.spec = spec
+        self.fields = fields
+        self.url = url
+
+
+class Extraction:
+    """The values read for a PageSpec: None for a text or attribute field that
+    matched nothing, a list for many=True fields and a bool for exists=True ones.
+    """
+
+    def __init__(self, spec, values):
+        self.spec = spec
+        self.values = values
+        self.missing = [
+            name
+            for name, field in spec.fields.items()
+            if field.required and not values.get(name)
+        ]
+
+    def __getitem__(self, name):
+        return self.values[name]
+
+    def require(self, url):
+        """Raise MissingFieldsError unless every required field was found"""
+        if not self.missing:
+            return self
+        metrics = get_metrics()
+        for name in self.missing:
+            metrics.incr(f"extract.missing.{self.spec.name}.{name}")
+        raise MissingFieldsError(self.spec, self.missing, url)
+
+
+def extract(page, spec):
+    """Read every field of spec from a sync API page in one evaluate call"""
+    with get_metrics().span("extract"):
+        return Extraction(spec, page.evaluate(EXTRACT_JS, spec.arguments()))
+
+
+async def extract_async(page, spec):
+    with get_metrics().span("extract"):
+        return Extraction(spec, await page.evaluate(EXTRACT_JS, spec.arguments()))
+
+
+def job_location(job):
+    """'Country + details' of a PARENT_JOB extraction, or None without a country"""
+    if not job["country"]:
+        return None
+    if job["location_details"]:
+        return f"{job['country']} + {job['location_details']}"
+    return job["country"]
+
+
+LISTING = PageSpec("listing", {"links": Field("a.air3-link", "href", many=True)})
+
+PARENT_JOB = PageSpec(
+    "parent_job",
+    {
+        "title": Field(JOB_TITLE, required=True),
+        "description": Field(JOB_DESCRIPTION, required=True),
+        "country": Field(".cfe-ui-job-about-client li:nth-of-type(1) strong"),
+        "location_details": Field(
+            ".cfe-ui-job-about-client li:nth-of-type(1) span:first-child"
+        ),
+        "has_in_progress": Field(IN_PROGRESS_SECTION, exists=True),
+        # Only in the server HTML; the browser renders them on a click
+        "in_progress_links": Field(IN_PROGRESS_LINKS, "href", many=True),
+    },
+)
+
+IN_PROGRESS_LIST = PageSpec(
+    "in_progress_list", {"links": Field(IN_PROGRESS_LINKS, "href", many=True)}
+)
+
+IN_PROGRESS_JOB = PageSpec(
+    "in_progress_job",
+    {
+        "title": Field(JOB_TITLE, required=True),
+        "description": Field(JOB_DESCRIPTION, required=True),
+    },
+)
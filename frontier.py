@@ -0,0 +1,197 @@
+from datetime import datetime
+from config import absolute_url
+from retry import PERMANENT, classify
+
+SEARCH = "search"
+PARENT = "parent"
+IN_PROGRESS = "in_progress"
+
+PENDING = "pending"
+DONE = "done"
+FAILED = "failed"
+# Permanently failed (e.g. 404): never retried, not even by --resume
+GONE = "gone"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS frontier (
+    run_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    url TEXT NOT NULL,
+    parent_url TEXT NOT NULL DEFAULT '',
+    state TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    updated_at TEXT,
+    PRIMARY KEY (run_id, kind, url, parent_url)
+);
+CREATE INDEX IF NOT EXISTS frontier_parent_url ON frontier (run_id, kind, parent_url);
+"""
+
+
+class Frontier:
+    """Durable per-run work list: the state of every URL the run has to visit.
+
+    Lives in the result store's database and commits on every state change,
+    so a crashed or blocked run can be resumed without re-fetching pages that
+    were already done.
+
+    With a SeenIndex attached (incremental mode), URLs scraped within its TTL
+    are not added at all and never-seen URLs are queued ahead of stale ones.
+
+    With an output attached, a parent job is passed to
+    output.parent_settled(url) when the parent is done and none of its
+    in-progress jobs is pending anymore.
+    """
+
+    def __init__(self, store, max_attempts=3, seen=None, output=None):
+        self.store = store
+        self.conn = store.conn
+        self.lock = store.lock
+        self.max_attempts = max_attempts
+        self.seen = seen
+        self.output = output
+        self.conn.executescript(SCHEMA)
+
+    @staticmethod
+    def latest_run_id(conn):
+        """Return the id of the most recent run recorded in the frontier, if any"""
+        conn.executescript(SCHEMA)
+        row = conn.execute("SELECT MAX(run_id) FROM frontier").fetchone()
+        return row[0]
+
+    @property
+    def run_id(self):
+        return self.store.run_id
+
+    def add(self, kind, urls, parent_url=""):
+        """Add URLs as pending work; URLs already in the frontier keep their state"""
+        with self.lock:
+            if self.seen and kind != SEARCH:
+                urls, fresh = self.seen.prioritize(urls)
+                if fresh:
+                    print(f"Skipping {len(fresh)} {kind} jobs scraped recently")
+                if kind == IN_PROGRESS:
+                    for url in fresh:
+                        self.store.reuse_in_progress_details(parent_url, url)
+
+            now = datetime.now().isoformat()
+            with self.conn:
+                self.conn.executemany(
+                    """
+                    INSERT OR IGNORE INTO frontier (run_id, kind, url, parent_url, updated_at)
+                    VALUES (?, ?, ?, ?, ?)
+                    """,
+                    [(self.run_id, kind, url, parent_url, now) for url in urls if url],
+                )
+
+    def state(self, kind, url, parent_url=""):
+        """Return (state, attempts) of a URL, or (None, 0) if it is not in the frontier"""
+        with self.lock:
+            row = self.conn.execute(
+                """
+                SELECT state, attempts FROM frontier
+                WHERE run_id = ? AND kind = ? AND url = ? AND parent_url = ?
+                """,
+                (self.run_id, kind, url, parent_url),
+            ).fetchone()
+            return (row["state"], row["attempts"]) if row else (None, 0)
+
+    def is_pending(self, kind, url, parent_url=""):
+        """Whether the URL still needs work in this run"""
+        state, attempts = self.state(kind, url, parent_url)
+        return state == PENDING or (state == FAILED and attempts < self.max_attempts)
+
+    def is_done(self, kind, url, parent_url=""):
+        return self.state(kind, url, parent_url)[0] == DONE
+
+    def pending(self, kind):
+        """Return (url, parent_url) pairs that still need work, in insertion order"""
+        with self.lock:
+            rows = self.conn.execute(
+                """
+                SELECT url, parent_url FROM frontier
+                WHERE run_id = ? AND kind = ?
+                  AND (state = ? OR (state = ? AND attempts < ?))
+                ORDER BY rowid
+                """,
+                (self.run_id, kind, PENDING, FAILED, self.max_attempts),
+            ).fetchall()
+            return [(row["url"], row["parent_url"]) for row in rows]
+
+    def mark_done(self, kind, url, parent_url=""):
+        self._set_state(kind, url, parent_url, DONE, None)
+        if self.seen and kind != SEARCH:
+            self.seen.mark(url, kind)
+        if kind in (PARENT, IN_PROGRESS):
+            self._check_settled(parent_url or absolute_url(url))
+
+    def mark_failed(self, kind, url, parent_url="", error=None):
+        permanent = isinstance(error, Exception) and classify(error) == PERMANENT
+        self._set_state(kind, url, parent_url, GONE if permanent else FAILED, error)
+        if kind == IN_PROGRESS:
+            self._check_settled(parent_url)
+
+    def _check_settled(self, parent_url):
+        """Hand a parent job to the output once none of its in-progress jobs is pending.
+
+        In-progress jobs that failed but may still be retried do not hold the
+        parent back, since nothing retries them before --resume. The parent
+        is handed over as incomplete then, and again when one of them is done.
+        """
+        if not self.output:
+            return
+        with self.lock:
+            row = self.conn.execute(
+                """
+                SELECT SUM(state = ?) AS pending,
+                       SUM(state = ? AND attempts < ?) AS retryable
+                FROM frontier
+                WHERE run_id = ? AND kind = ? AND parent_url = ?
+                """,
+                (
+                    PENDING,
+                    FAILED,
+                    self.max_attempts,
+                    self.run_id,
+                    IN_PROGRESS,
+                    parent_url,
+                ),
+            ).fetchone()
+        # Outside the lock: the output takes its own lock, then the store's
+        if not row["pending"]:
+            self.output.parent_settled(parent_url, complete=not row["retryable"])
+
+    def _set_state(self, kind, url, parent_url, state, error):
+        with self.lock:
+            with self.conn:
+                self.conn.execute(
+                    """
+                    UPDATE frontier
+                    SET state = ?, attempts = attempts + 1, last_error = ?, updated_at = ?
+                    WHERE run_id = ? AND kind = ? AND url = ? AND parent_url = ?
+                    """,
+                    (
+                        state,
+                        str(error) if error else None,
+                        datetime.now().isoformat(),
+                        self.run_id,
+                        kind,
+                        url,
+                        parent_url,
+                    ),
+                )
+
+    def summary(self):
+        """Return {kind: {state: count}} for this run"""
+        with self.lock:
+            rows = self.conn.execute(
+                """
+                SELECT kind, state, COUNT(*) AS count FROM frontier
+                WHERE run_id = ? GROUP BY kind, state
+                """,
+                (self.run_id,),
+            ).fetchall()
+            summary = {}
+            for row in rows:
+                summary.setdefault(row["kind"], {})[row["state"]] = row["count"]
+            return summary
@@ -0,0 +1,440 @@
+import gzip
+import http.client
+import json
+import os
+import re
+import threading
+import time
+import zlib
+from html.parser import HTMLParser
+from http.cookies import SimpleCookie
+from urllib.parse import urljoin, urlparse
+from config import absolute_url
+from extraction import PARENT_JOB, Extraction, job_location
+from metrics import get_metrics
+from rate_limiter import get_rate_limiter
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+
+VOID_TAGS = {
+    "area",
+    "base",
+    "br",
+    "col",
+    "embed",
+    "hr",
+    "img",
+    "input",
+    "link",
+    "meta",
+    "source",
+    "track",
+    "wbr",
+}
+BLOCK_TAGS = {"p", "div", "li", "ul", "ol", "section", "h1", "h2", "h3", "h4", "tr"}
+SKIPPED_TAGS = {"script", "style", "template", "noscript"}
+# Their content is not part of the DOM a browser with JavaScript builds
+OPAQUE_TAGS = {"template", "noscript"}
+
+# The browser path's captcha and security-check classes, and Cloudflare's
+# challenge page. Not "challenge-platform" alone: Cloudflare's bot detection
+# script under that path is injected into ordinary pages too.
+SECURITY_CHECK_PATTERN = re.compile(
+    r"""class=["'][^"']*(captcha|security-check)|cf-chl-|_cf_chl_opt"""
+    r"|<title>\s*Just a moment",
+    re.I,
+)
+
+
+class Node:
+    """Element of a parsed HTML document"""
+
+    def __init__(self, tag, attrs, parent=None):
+        self.tag = tag
+        self.attrs = attrs
+        self.parent = parent
+        self.children = []
+        self.classes = set((attrs.get("class") or "").split())
+
+    def elements(self):
+        return [child for child in self.children if isinstance(child, Node)]
+
+    def iter(self):
+        for child in self.elements():
+            yield child
+            yield from child.iter()
+
+    def inner_text(self):
+        """Approximate the browser's innerText: block elements break lines"""
+        parts = []
+        self._collect_text(parts)
+        lines = "".join(parts).split("\n")
+        return "\n".join(
+            " ".join(line.split()) for line in lines if line.strip()
+        ).strip()
+
+    def _collect_text(self, parts):
+        for child in self.children:
+            if isinstance(child, str):
+                # Line breaks in the source are only whitespace, as in a browser
+                parts.append(re.sub(r"\s+", " ", child))
+            elif child.tag == "br":
+                parts.append("\n")
+            elif child.tag not in SKIPPED_TAGS:
+                if child.tag in BLOCK_TAGS:
+                    parts.append("\n")
+                child._collect_text(parts)
+                if child.tag in BLOCK_TAGS:
+                    parts.append("\n")
+
+
+class _TreeBuilder(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.root = Node("#document", {})
+        self.current = self.root
+        self.scripts = []
+        self._script = None
+        self._opaque = 0
+
+    def handle_starttag(self, tag, attrs):
+        if self._opaque:
+            self._opaque += tag in OPAQUE_TAGS
+            return
+        node = Node(tag, {name: value or "" for name, value in attrs}, self.current)
+        self.current.children.append(node)
+        if tag == "script":
+            self._script = (node.attrs, [])
+        if tag in OPAQUE_TAGS:
+            self._opaque = 1
+        if tag not in VOID_TAGS:
+            self.current = node
+
+    def handle_endtag(self, tag):
+        if self._opaque:
+            self._opaque -= tag in OPAQUE_TAGS
+            if self._opaque:
+                return
+        if tag == "script" and self._script is not None:
+            self.scripts.append((self._script[0], "".join(self._script[1])))
+            self._script = None
+        node = self.current
+        while node is not self.root and node.tag != tag:
+            node = node.parent
+        if node is not self.root:
+            self.current = node.parent
+
+    def handle_data(self, data):
+        if self._opaque:
+            return
+        if self._script is not None:
+            self._script[1].append(data)
+        else:
+            self.current.children.append(data)
+
+
+def _parse_compound(text):
+    """Split 'li:nth-of-type(1)' or 'p.text-body-sm' into matcher parts"""
+    match = re.fullmatch(r"([a-z0-9]*)((?:\.[\w-]+)*)((?::[\w-]+(?:\(\d+\))?)*)", text)
+    if not match:
+        raise ValueError(f"Unsupported selector: {text}")
+    tag, classes, pseudos = match.groups()
+    return (
+        tag or None,
+        set(classes.split(".")[1:]),
+        re.findall(r":([\w-]+)(?:\((\d+)\))?", pseudos),
+    )
+
+
+def _matches(node, compound):
+    tag, classes, pseudos = compound
+    if tag and node.tag != tag:
+        return False
+    if not classes <= node.classes:
+        return False
+    for name, argument in pseudos:
+        siblings = node.parent.elements() if node.parent else [node]
+        if name == "first-child" and siblings[0] is not node:
+            return False
+        if name == "nth-of-type":
+            same_type = [sibling for sibling in siblings if sibling.tag == node.tag]
+            if same_type.index(node) + 1 != int(argument):
+                return False
+    return True
+
+
+def select(root, selector):
+    """Find elements matching a descendant-combinator CSS selector.
+
+    Supports tags, classes, :first-child and :nth-of-type(n), which covers
+    every selector the scrapers use.
+    """
+    compounds = [_parse_compound(part) for part in selector.split()]
+    results = []
+    for node in root.iter():
+        if not _matches(node, compounds[-1]):
+            continue
+        remaining = compounds[:-1]
+        ancestor = node.parent
+        while remaining and ancestor is not None:
+            if _matches(ancestor, remaining[-1]):
+                remaining = remaining[:-1]
+            ancestor = ancestor.parent
+        if not remaining:
+            results.append(node)
+    return results
+
+
+def select_one(root, selector):
+    found = select(root, selector)
+    return found[0] if found else None
+
+
+def parse_document(html):
+    """Parse HTML into (root node, [(script attrs, script text)])"""
+    builder = _TreeBuilder()
+    builder.feed(html)
+    builder.close()
+    return builder.root, builder.scripts
+
+
+def _embedded_job_posting(scripts):
+    """Title and description from JSON-LD JobPosting state, if the page has it"""
+    for attrs, text in scripts:
+        if attrs.get("type") != "application/ld+json":
+            continue
+        try:
+            data = json.loads(text)
+        except ValueError:
+            continue
+        for item in data if isinstance(data, list) else [data]:
+            if isinstance(item, dict) and item.get("@type") == "JobPosting":
+                return item.get("title"), item.get("description")
+    return None, None
+
+
+def _read(node, attribute):
+    return node.attrs.get(attribute) if attribute else node.inner_text()
+
+
+def extract_document(root, spec):
+    """Read the fields of an extraction.PageSpec from a parsed document"""
+    values = {}
+    for name, field in spec.fields.items():
+        if field.exists:
+            values[name] = select_one(root, field.selector) is not None
+        elif field.many:
+            values[name] = [
+                _read(node, field.attribute) for node in select(root, field.selector)
+            ]
+        else:
+            node = select_one(root, field.selector)
+            values[name] = _read(node, field.attribute) if node else None
+    return Extraction(spec, values)
+
+
+def parse_job_page(html):
+    """Extract job fields from server-rendered HTML.
+
+    Returns a dict with title, description, location and in_progress_links.
+    Missing fields are None; in_progress_links is None when the page has an
+    in-progress section whose links are only rendered by the browser.
+    """
+    root, scripts = parse_document(html)
+    job = extract_document(root, PARENT_JOB)
+
+    title = job["title"]
+    description = job["description"]
+    if not title or not description:
+        embedded_title, embedded_description = _embedded_job_posting(scripts)
+        title = title or embedded_title
+        description = description or embedded_description
+
+    in_progress_links = []
+    if job["has_in_progress"]:
+        in_progress_links = (
+            list(dict.fromkeys(link for link in job["in_progress_links"] if link))
+            or None
+        )
+
+    return {
+        "title": title,
+        "description": description,
+        "location": job_location(job),
+        "in_progress_links": in_progress_links,
+    }
+
+
+class HttpFetcher:
+    """Keep-alive HTTP client for job pages that shares the browser's cookies.
+
+    Each thread keeps one persistent connection per host. Requests are paced
+    by the shared rate limiter; cookies rotated by the site via Set-Cookie
+    are picked up for later requests.
+    """
+
+    def __init__(self, cookies=None, timeout=30, max_redirects=5):
+        self.cookies = {cookie["name"]: cookie["value"] for cookie in cookies or []}
+        self.timeout = timeout
+        self.max_redirects = max_redirects
+        self.requests = 0
+        self.fallbacks = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _connection(self, scheme, netloc):
+        connections = self._local.__dict__.setdefault("connections", {})
+        key = (scheme, netloc)
+        if key not in connections:
+            connection_class = (
+                http.client.HTTPSConnection
+                if scheme == "https"
+                else http.client.HTTPConnection
+            )
+            connections[key] = connection_class(netloc, timeout=self.timeout)
+        return connections[key]
+
+    def _drop_connection(self, scheme, netloc):
+        connection = self._local.__dict__.get("connections", {}).pop(
+            (scheme, netloc), None
+        )
+        if connection:
+            connection.close()
+
+    def _request(self, url):
+        parsed = urlparse(url)
+        path = parsed.path or "/"
+        if parsed.query:
+            path += "?" + parsed.query
+        with self._lock:
+            cookie_header = "; ".join(f"{k}={v}" for k, v in self.cookies.items())
+        headers = {
+            "User-Agent": USER_AGENT,
+            "Accept": "text/html,application/xhtml+xml",
+            "Accept-Encoding": "gzip, deflate",
+            "Accept-Language": "en-US,en;q=0.9",
+            "Connection": "keep-alive",
+        }
+        if cookie_header:
+            headers["Cookie"] = cookie_header
+
+        for attempt in range(2):
+            connection = self._connection(parsed.scheme, parsed.netloc)
+            try:
+                connection.request("GET", path, headers=headers)
+                response = connection.getresponse()
+                body = response.read()
+                break
+            except (http.client.HTTPException, ConnectionError):
+                # The server closed an idle keep-alive connection; reconnect once
+                self._drop_connection(parsed.scheme, parsed.netloc)
+                if attempt:
+                    raise
+
+        self._store_cookies(response.headers.get_all("Set-Cookie") or [])
+        encoding = response.headers.get("Content-Encoding", "")
+        if encoding == "gzip":
+            body = gzip.decompress(body)
+        elif encoding == "deflate":
+            body = zlib.decompress(body)
+        return response.status, response.headers, body.decode("utf-8", "replace")
+
+    def _store_cookies(self, headers):
+        for header in headers:
+            cookie = SimpleCookie()
+            try:
+                cookie.load(header)
+            except Exception:
+                continue
+            with self._lock:
+                for name, morsel in cookie.items():
+                    self.cookies[name] = morsel.value
+
+    def get(self, url):
+        """GET a page following redirects; returns (status, html)"""
+        limiter = get_rate_limiter()
+        for _ in range(self.max_redirects + 1):
+            limiter.wait()
+            started = time.monotonic()
+            with get_metrics().span("http.get"):
+                status, headers, html = self._request(url)
+            self.requests += 1
+            if status in (301, 302, 303, 307, 308) and headers.get("Location"):
+                limiter.record(status, time.monotonic() - started)
+                url = urljoin(url, headers["Location"])
+                continue
+            limiter.record(
+                status,
+                time.monotonic() - started,
+                captcha=bool(SECURITY_CHECK_PATTERN.search(html)),
+            )
+            return status, html
+        raise Exception(f"Too many redirects for {url}")
+
+    def fetch_job(self, link):
+        """Fetch and parse a job page; returns None when the browser is needed"""
+        try:
+            status, html = self.get(absolute_url(link))
+        except Exception as e:
+            print(f"HTTP fetch failed for {link}: {e}")
+            return self._fallback(link, "request error")
+
+        if status != 200:
+            return self._fallback(link, f"status {status}")
+        if SECURITY_CHECK_PATTERN.search(html):
+            return self._fallback(link, "security check")
+        return parse_job_page(html)
+
+    def fetch_parent_job(self, link):
+        """Parent job details and in-progress links, or None to use the browser"""
+        job = self.fetch_job(link)
+        if job is None:
+            return None
+        if not job["title"] or not job["description"] or not job["location"]:
+            return self._fallback(link, "details not in server HTML")
+        if job["in_progress_links"] is None:
+            return self._fallback(link, "in-progress jobs need the browser")
+        return job
+
+    def fetch_in_progress_job(self, link):
+        """(title, description) of an in-progress job, or None to use the browser"""
+        job = self.fetch_job(link)
+        if job is None:
+            return None
+        if not job["title"] or not job["description"]:
+            return self._fallback(link, "details not in server HTML")
+        return job["title"], job["description"]
+
+    def _fallback(self, link, reason):
+        self.fallbacks += 1
+        get_metrics().incr("http.fallbacks")
+        print(f"Falling back to the browser for {link} ({reason})")
+        return None
+
+    def report(self):
+        print(
+            f"\nHTTP backend: {self.requests} requests, "
+            f"{self.fallbacks} pages fell back to the browser"
+        )
+
+
+_fetcher = None
+
+
+def configure_http_fetcher(cookies, backend=None):
+    """Enable the HTTP backend when backend (or UPWORK_FETCH_BACKEND) is "http".
+
+    Returns the fetcher, or None when every page goes through the browser.
+    """
+    global _fetcher
+    backend = backend or os.getenv("UPWORK_FETCH_BACKEND", "browser")
+    if backend == "http":
+        _fetcher = HttpFetcher(cookies)
+    else:
+        _fetcher = None
+    return _fetcher
+
+
+def get_http_fetcher():
+    """Return the configured HTTP fetcher, or None when pages go through the browser"""
+    return _fetcher
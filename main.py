@@ -1,72 +1,48 @@
-from parent_jobs import scrape_parent_job_links, scrape_parent_job
-from in_progress_jobs import (
-    find_in_progress_links,
-    scrape_in_progress_job,
-    update_csv_with_progress_data,
-    update_csv_with_details,
+from parent_jobs import scrape_parent_job
+from pipeline import (
+    InProgressPipeline,
+    group_by_job,
+    process_in_progress_group,
+    record_parent_job,
 )
+from async_engine import AsyncScrapeEngine
+from result_store import ResultStore
+from frontier import Frontier, PARENT, IN_PROGRESS
+from seen_index import SeenIndex
+import argparse
+import asyncio
 import os
-import csv
-from datetime import datetime
-from dotenv import load_dotenv
 import time
-import random
+from datetime import datetime
 import sys
-from playwright.sync_api import sync_playwright
-
-# Load environment variables from .env file
-load_dotenv()
-
-
-def get_cookies():
-    """Get all required cookies from environment variables"""
-    cookies = []
-
-    # Main cookies for authorization
-    required_cookies = {
-        "master_access_token": os.getenv("UPWORK_MASTER_TOKEN"),
-        "oauth2_global_js_token": os.getenv("UPWORK_OAUTH_TOKEN"),
-        "visitor_id": os.getenv("UPWORK_VISITOR_ID"),
-        "__cf_bm": os.getenv("UPWORK_CF_BM"),
-    }
-
-    # Check for main token presence
-    if (
-        not required_cookies["master_access_token"]
-        or required_cookies["master_access_token"] == "your_master_token_here"
-    ):
-        raise ValueError("Please set your UPWORK_MASTER_TOKEN in .env file")
-
-    # Form cookies list
-    for name, value in required_cookies.items():
-        if value:
-            cookies.append(
-                {"name": name, "value": value, "domain": ".upwork.com", "path": "/"}
-            )
-
-    return cookies
-
-
-def save_to_csv(jobs_data):
-    """Saves data to CSV file and returns the filename"""
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"upwork_jobs_{timestamp}.csv"
-
-    if jobs_data:
-        with open(filename, "w", newline="", encoding="utf-8") as file:
-            writer = csv.DictWriter(file, fieldnames=jobs_data[0].keys())
-            writer.writeheader()
-            writer.writerows(jobs_data)
-        print(f"\nData saved to file: {filename}")
-        print(f"Total jobs saved: {len(jobs_data)}")
-        return filename
-    else:
+from browser_pool import BrowserPool, use_pool
+from accounts import get_cookies, load_accounts
+from coordinator import ShardCoordinator
+from enrichment import Enricher
+from http_fetch import configure_http_fetcher
+from metrics import get_metrics
+from rate_limiter import get_rate_limiter
+from search_queries import discover_links, load_queries
+from sinks import JobOutput, parse_formats
+from watch import run_watch
+
+
+def save_to_csv(store):
+    """Exports this run's jobs from the result store to CSV and returns the filename"""
+    if not store.parent_count():
         print("No data to save")
         return None
 
+    filename = f"upwork_jobs_{store.run_id}.csv"
+    with get_metrics().span("export_csv"):
+        count = store.export_csv(filename)
+    print(f"\nData saved to file: {filename}")
+    print(f"Total jobs saved: {count}")
+    return filename
+
 
-def process_in_progress_jobs(csv_filename):
-    """Process in-progress jobs from CSV and update with details"""
+def process_in_progress_jobs(store, frontier, pool=None):
+    """Process pending in-progress jobs from the frontier and store their details"""
     try:
         cookies = get_cookies()
         print("Cookies successfully loaded")
@@ -74,65 +50,61 @@ def process_in_progress_jobs(csv_filename):
         print(f"Error loading cookies: {e}")
         return
 
-    print("\nProcessing in-progress jobs from CSV...")
-    with open(csv_filename, "r", encoding="utf-8") as file:
-        reader = csv.DictReader(file)
-        rows = list(reader)
-
-        with sync_playwright() as p:
-            browser = p.chromium.launch(
-                headless=True,
-                args=[
-                    "--disable-blink-features=AutomationControlled",
-                    "--no-sandbox",
-                    "--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-                ],
-            )
+    # A job listed under several parents is fetched once for all of them
+    jobs = list(group_by_job(frontier.pending(IN_PROGRESS)).values())
+    print(f"\nProcessing {len(jobs)} unique in-progress jobs...")
+    with use_pool(pool, cookies) as pool:
+        for i, entries in enumerate(jobs, 1):
+            print(f"Processing in-progress job {i}/{len(jobs)}: {entries[0][0]}")
+            process_in_progress_group(entries, cookies, store, frontier, pool)
+
+
+def discovery_options(frontier, watch=False):
+    """Search queries and pagination settings for job discovery.
+
+    Watch mode walks every page: jobs due for a recheck sit below the ones
+    the last cycle checked, so stopping at a fresh job would never reach
+    them. The frontier skips the fresh ones instead.
+    """
+    return {
+        "queries": load_queries(),
+        # Queries searched at the same time, each with its own browser
+        "parallel": int(os.getenv("UPWORK_SEARCH_PARALLEL", "1")),
+        "per_page": int(os.getenv("UPWORK_SEARCH_PAGE_SIZE", "10")),
+        "max_pages": int(os.getenv("UPWORK_SEARCH_MAX_PAGES", "5")),
+        # In incremental mode, stop at the first job scraped within the TTL
+        # before this run started
+        "stop_at": (
+            frontier.seen.fresh_before(time.time())
+            if frontier.seen and not watch
+            else None
+        ),
+    }
+
 
-            for row in rows:
-                if row["in_progress_links"]:
-                    parent_url = row["url"]
-                    in_progress_links = row["in_progress_links"].split(" ; ")
-                    print(f"\nProcessing in-progress jobs for {parent_url}")
-
-                    for i, link in enumerate(in_progress_links, 1):
-                        if not link:
-                            continue
-                        print(f"Processing in-progress job {i}/{len(in_progress_links)}")
-
-                        try:
-                            # Get job details with retries and timeouts
-                            title, description = scrape_in_progress_job(
-                                link, cookies, browser
-                            )
-                            if (
-                                title
-                                and description
-                                and title != "Title not found"
-                                and description != "Description not found"
-                            ):
-                                # Update CSV with details
-                                update_csv_with_details(
-                                    parent_url, link, title, description, csv_filename
-                                )
-                                print(f"Updated details for {link}")
-                            else:
-                                print(f"Failed to get valid details for {link}")
-
-                            # Add delay between jobs
-                            time.sleep(random.uniform(15, 30))
-
-                        except Exception as e:
-                            print(f"Error processing in-progress job {link}: {e}")
-                            continue
-
-                    # Add longer delay between parent jobs
-                    time.sleep(random.uniform(30, 60))
-            browser.close()
-
-
-def scrape_parent_jobs():
-    """Scrape parent jobs and collect in-progress links"""
+def scrape_one_parent(link, cookies, store, frontier, pool=None, pipeline=None):
+    """Scrape one parent job and record its in-progress links in the frontier.
+
+    With a pipeline, the in-progress links are handed to its detail workers
+    straight away.
+    """
+    try:
+        # Get parent job details and in-progress links
+        with get_metrics().span("parent_job"):
+            job_data = scrape_parent_job(link, cookies, pool=pool)
+        pending = record_parent_job(link, job_data, store, frontier)
+
+        if pipeline:
+            for in_progress_link in pending:
+                pipeline.submit(job_data["url"], in_progress_link)
+
+    except Exception as e:
+        frontier.mark_failed(PARENT, link, error=e)
+        print(f"Error processing parent job {link}: {e}")
+
+
+def scrape_parent_jobs(store, frontier, pool=None, pipeline=None, discovery=None):
+    """Discover parent jobs page by page and scrape each one as it is found"""
     print("Starting: Collecting parent jobs and in-progress links...")
 
     try:
@@ -143,54 +115,263 @@ def scrape_parent_jobs():
         return
 
     try:
-        # Collect all job links
-        print("\nGetting job list...")
-        try:
-            job_links = scrape_parent_job_links(cookies)
-            if not job_links:
-                print("Failed to get job links")
-                return
-            print(f"Found jobs: {len(job_links)}")
-        except Exception as e:
-            print(f"Error getting job links: {e}")
-            return
-
-        # List to store all jobs
-        jobs_data = []
+        # Parent jobs left over from a resumed run come first
+        leftovers = [url for url, _ in frontier.pending(PARENT)]
+        for i, link in enumerate(leftovers, 1):
+            print(f"\nProcessing remaining parent job {i}/{len(leftovers)}...")
+            scrape_one_parent(link, cookies, store, frontier, pool, pipeline)
 
-        # Collect parent jobs and in-progress links
         print("\nCollecting parent job information and in-progress links...")
-        for i, link in enumerate(job_links, 1):
-            print(f"\nProcessing parent job {i}/{len(job_links)}...")
-            try:
-                # Get parent job details and in-progress links
-                job_data = scrape_parent_job(link, cookies)
-                if not job_data:
-                    print(f"Failed to get parent job details for {link}")
-                    continue
+        found = 0
+        discovery = discovery or discovery_options(frontier)
+        for link in discover_links(frontier, cookies, pool, **discovery):
+            found += 1
+            frontier.add(PARENT, [link])
+            if frontier.is_pending(PARENT, link):
+                print(f"\nProcessing parent job {found}...")
+                scrape_one_parent(link, cookies, store, frontier, pool, pipeline)
+
+        if not found:
+            print("No new job links found")
 
-                jobs_data.append(job_data)
+    except Exception as e:
+        print(f"Error during scraping: {e}")
 
-                # Add delay between parent jobs
-                time.sleep(random.uniform(10, 20))
 
-            except Exception as e:
-                print(f"Error processing parent job {link}: {e}")
-                continue
+def run_sync_engine(store, frontier, detail_workers, discovery=None):
+    """Scrape parents on this thread while detail workers handle in-progress jobs.
 
-        # Save data to CSV
-        csv_filename = save_to_csv(jobs_data)
-        return csv_filename
+    With no detail workers the two phases run one after the other.
+    """
+    cookies = get_cookies()
+    # One browser pool for the parent phase, reused for every page
+    with BrowserPool.from_env(cookies) as pool:
+        if detail_workers < 1:
+            scrape_parent_jobs(store, frontier, pool, discovery=discovery)
+            process_in_progress_jobs(store, frontier, pool)
+            return
 
-    except Exception as e:
-        print(f"Error during scraping: {e}")
+        with InProgressPipeline(cookies, store, frontier, detail_workers) as pipeline:
+            # In-progress jobs left over from a resumed run go first
+            for link, parent_url in frontier.pending(IN_PROGRESS):
+                pipeline.submit(parent_url, link)
+            scrape_parent_jobs(store, frontier, pool, pipeline, discovery)
+
+
+def run_async_engine(store, frontier, concurrency, discovery=None):
+    """Run both phases as concurrent tasks on the asyncio engine"""
+    engine = AsyncScrapeEngine(
+        get_cookies(),
+        store,
+        frontier,
+        discovery=discovery or discovery_options(frontier),
+        concurrency=concurrency,
+        pool_size=int(os.getenv("UPWORK_POOL_SIZE", "2")),
+    )
+    asyncio.run(engine.run())
+
+
+def run_sharded(store, frontier, args):
+    """Scrape with worker processes, one browser pool and account each"""
+    coordinator = ShardCoordinator(
+        store,
+        frontier,
+        load_accounts(args.accounts),
+        processes=args.processes,
+        shard_size=int(os.getenv("UPWORK_SHARD_SIZE", "5")),
+        fetch_backend=args.fetch_backend,
+        serve_address=args.serve,
+        authkey=os.getenv("UPWORK_COORDINATOR_AUTHKEY", "").encode(),
+        worker_timeout=float(os.getenv("UPWORK_COORDINATOR_WORKER_TIMEOUT", "0")),
+    )
+    coordinator.run(discovery_options(frontier, args.watch))
+
+
+def is_sharded(args):
+    return args.processes > 0 or bool(args.serve)
+
+
+def run_engine(store, frontier, args):
+    """Scrape the frontier's work with the engine chosen on the command line"""
+    if is_sharded(args):
+        run_sharded(store, frontier, args)
+    elif args.engine == "async":
+        run_async_engine(
+            store, frontier, args.concurrency, discovery_options(frontier, args.watch)
+        )
+    else:
+        run_sync_engine(
+            store,
+            frontier,
+            args.detail_workers,
+            discovery_options(frontier, args.watch),
+        )
+
+
+def run_scrape(store, frontier, args):
+    """Scrape the frontier's work, then enrich the run's jobs when asked to"""
+    run_engine(store, frontier, args)
+    if args.enrich:
+        Enricher.from_env(store).run()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Scrape Upwork jobs")
+    parser.add_argument(
+        "--engine",
+        choices=["sync", "async"],
+        default=os.getenv("UPWORK_ENGINE", "sync"),
+        help="sync processes one page at a time, async runs pages concurrently",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=int(os.getenv("UPWORK_CONCURRENCY", "3")),
+        help="maximum number of pages open at once per host (async engine)",
+    )
+    parser.add_argument(
+        "--detail-workers",
+        type=int,
+        default=int(os.getenv("UPWORK_DETAIL_WORKERS", "1")),
+        help="threads fetching in-progress jobs while parents are scraped "
+        "(sync engine, 0 runs the phases one after the other)",
+    )
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=int(os.getenv("UPWORK_PROCESSES", "0")),
+        help="shard the crawl across this many worker processes "
+        "(0 scrapes in this process with --engine)",
+    )
+    parser.add_argument(
+        "--accounts",
+        default=os.getenv("UPWORK_ACCOUNTS_FILE"),
+        help="JSON file with one cookie set per account, assigned to workers "
+        "round-robin (default: the cookies in .env)",
+    )
+    parser.add_argument(
+        "--serve",
+        default=os.getenv("UPWORK_COORDINATOR_ADDRESS"),
+        help="host:port to serve the work queues on, so workers started with "
+        "`python coordinator.py --connect` on other machines can join",
+    )
+    parser.add_argument(
+        "--fetch-backend",
+        choices=["browser", "http"],
+        default=os.getenv("UPWORK_FETCH_BACKEND", "browser"),
+        help="http fetches job pages without a browser where the server HTML "
+        "has everything, falling back to the browser otherwise",
+    )
+    parser.add_argument(
+        "--output",
+        type=parse_formats,
+        default=os.getenv("UPWORK_OUTPUT_FORMATS", "csv"),
+        help="comma-separated output formats: csv (exported at the end), jsonl "
+        "and parquet (streamed as each parent job finishes)",
+    )
+    parser.add_argument(
+        "--enrich",
+        action="store_true",
+        default=os.getenv("UPWORK_ENRICH", "0") == "1",
+        help="after scraping, parse budgets and locations, detect languages and "
+        "score relevance to UPWORK_KEYWORDS into the job_enrichment table",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="continue the most recent run, skipping work it already finished",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="skip jobs that were already scraped within the TTL",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="keep polling the search and report new and changed jobs as events",
+    )
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=float(os.getenv("UPWORK_WATCH_INTERVAL", "300")),
+        help="seconds between the starts of two watch cycles",
+    )
+    parser.add_argument(
+        "--recheck-hours",
+        type=float,
+        default=float(os.getenv("UPWORK_WATCH_RECHECK_HOURS", "1")),
+        help="in watch mode, how long a job goes unchecked before it is "
+        "fetched again to look for changes",
+    )
+    parser.add_argument(
+        "--ttl-hours",
+        type=float,
+        default=float(os.getenv("UPWORK_SEEN_TTL_HOURS", "24")),
+        help="how long a scraped job counts as fresh in incremental mode",
+    )
+    return parser.parse_args()
 
 
 if __name__ == "__main__":
+    args = parse_args()
     try:
-        csv_filename = scrape_parent_jobs()
-        if csv_filename:
-            process_in_progress_jobs(csv_filename)
+        run_id = datetime.now().strftime("%Y%m%d_%H%M%S")
+        with ResultStore.from_env(run_id) as store:
+            if args.resume:
+                previous_run_id = Frontier.latest_run_id(store.conn)
+                if previous_run_id:
+                    print(f"Resuming run {previous_run_id}")
+                    store.run_id = previous_run_id
+                else:
+                    print("No previous run to resume, starting a new one")
+            seen = (
+                SeenIndex(store.conn, args.ttl_hours, store.lock)
+                if args.incremental
+                else None
+            )
+            # Watch mode writes change events instead
+            output = None if args.watch else JobOutput.open(store, args.output)
+            frontier = Frontier(
+                store,
+                max_attempts=int(os.getenv("UPWORK_MAX_ATTEMPTS", "3")),
+                seen=seen,
+                output=output,
+            )
+
+            # Sharded workers set up their own fetcher with their account's
+            # cookies, so .env needs no cookies when --accounts is given
+            fetcher = None
+            if not is_sharded(args):
+                fetcher = configure_http_fetcher(get_cookies(), args.fetch_backend)
+
+            try:
+                if args.watch:
+                    run_watch(
+                        store,
+                        lambda frontier: run_scrape(store, frontier, args),
+                        args.interval,
+                        recheck_hours=args.recheck_hours,
+                        max_attempts=frontier.max_attempts,
+                    )
+                else:
+                    run_scrape(store, frontier, args)
+            finally:
+                get_rate_limiter().report()
+                if fetcher:
+                    fetcher.report()
+                print(f"\nFrontier state: {frontier.summary()}")
+                if output:
+                    output.close()
+                # Export whatever was collected, even after an interruption
+                if "csv" in args.output and not args.watch:
+                    save_to_csv(store)
+                metrics = get_metrics()
+                metrics.report()
+                print(
+                    "Metrics saved to file: "
+                    + metrics.write(f"upwork_metrics_{store.run_id}")
+                )
     except KeyboardInterrupt:
         print("\nScript execution interrupted by user")
     except Exception as e:
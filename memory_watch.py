@@ -0,0 +1,270 @@
+import asyncio
+import os
+import threading
+import weakref
+from metrics import get_metrics
+
+try:
+    import psutil
+except ImportError:
+    # Without psutil, process memory is read from /proc (Linux only)
+    psutil = None
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+# Playwright driver starts are serialized so a new driver can be told apart
+# from the drivers other threads start
+_start_lock = threading.Lock()
+# The same for the coroutines of one event loop
+_async_start_locks = weakref.WeakKeyDictionary()
+
+
+def _proc_ppids():
+    """{pid: parent pid} of every process, read from /proc"""
+    ppids = {}
+    for name in os.listdir("/proc"):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{name}/stat", encoding="utf-8") as f:
+                # The command name may contain spaces and parentheses
+                fields = f.read().rsplit(")", 1)[1].split()
+            ppids[int(name)] = int(fields[1])
+        except (OSError, IndexError, ValueError):
+            continue
+    return ppids
+
+
+def supported():
+    return psutil is not None or os.path.isdir("/proc")
+
+
+def descendants(pid):
+    """PIDs of every process below pid"""
+    if psutil:
+        try:
+            return [child.pid for child in psutil.Process(pid).children(recursive=True)]
+        except psutil.Error:
+            return []
+    if not os.path.isdir("/proc"):
+        return []
+    children = {}
+    for child, parent in _proc_ppids().items():
+        children.setdefault(parent, []).append(child)
+    found = []
+    todo = [pid]
+    while todo:
+        for child in children.get(todo.pop(), []):
+            found.append(child)
+            todo.append(child)
+    return found
+
+
+def _cmdline(pid):
+    if psutil:
+        try:
+            return psutil.Process(pid).cmdline()
+        except psutil.Error:
+            return []
+    try:
+        with open(f"/proc/{pid}/cmdline", "rb") as f:
+            return f.read().decode(errors="replace").split("\0")
+    except OSError:
+        return []
+
+
+def rss_mb(pid):
+    """Resident memory of one process in MB (0 once it has exited)"""
+    if psutil:
+        try:
+            return psutil.Process(pid).memory_info().rss / 1024 / 1024
+        except psutil.Error:
+            return 0.0
+    try:
+        with open(f"/proc/{pid}/statm", encoding="utf-8") as f:
+            return int(f.read().split()[1]) * PAGE_SIZE / 1024 / 1024
+    except (OSError, IndexError, ValueError):
+        return 0.0
+
+
+def tree_rss_mb(pid):
+    """Resident memory of a process and all of its descendants in MB.
+
+    Memory shared between Chromium's processes is counted once per process,
+    so this overstates the real footprint. It is still a reliable signal
+    of growth.
+    """
+    return sum(rss_mb(p) for p in [pid, *descendants(pid)])
+
+
+def _new_driver_pid(before):
+    new = [pid for pid in descendants(os.getpid()) if pid not in before]
+    drivers = [pid for pid in new if "run-driver" in _cmdline(pid)]
+    return drivers[0] if drivers else None
+
+
+def start_tracked(start):
+    """Call start() and return (playwright, PID of its driver process).
+
+    Browsers are children of the driver that launched them, so tracking
+    them from the driver keeps other threads' browsers out. The PID is None
+    where process memory cannot be read.
+    """
+    if not supported():
+        return start(), None
+    with _start_lock:
+        before = set(descendants(os.getpid()))
+        playwright = start()
+        return playwright, _new_driver_pid(before)
+
+
+async def start_tracked_async(start):
+    """Async counterpart of start_tracked() for a coroutine function"""
+    if not supported():
+        return await start(), None
+    loop = asyncio.get_running_loop()
+    lock = _async_start_locks.setdefault(loop, asyncio.Lock())
+    async with lock:
+        before = set(descendants(os.getpid()))
+        playwright = await start()
+        return playwright, _new_driver_pid(before)
+
+
+def launch_tracked(launch, driver_pid):
+    """Call launch() and return (browser, PID of the new browser's main process).
+
+    driver_pid is the PID start_tracked() returned for the Playwright
+    instance that launches the browser. The browser PID is None when that
+    is unknown.
+    """
+    if driver_pid is None:
+        return launch(), None
+    before = set(descendants(driver_pid))
+    browser = launch()
+    return browser, _new_browser_pid(driver_pid, before)
+
+
+async def launch_tracked_async(launch, driver_pid):
+    """Async counterpart of launch_tracked() for a coroutine function"""
+    if driver_pid is None:
+        return await launch(), None
+    before = set(descendants(driver_pid))
+    browser = await launch()
+    return browser, _new_browser_pid(driver_pid, before)
+
+
+def _new_browser_pid(driver_pid, before):
+    new = [pid for pid in descendants(driver_pid) if pid not in before]
+    # Chromium's helper processes (renderers, GPU, zygote) carry --type=
+    roots = [
+        pid
+        for pid in new
+        if not any(arg.startswith("--type=") for arg in _cmdline(pid))
+    ]
+    return roots[0] if roots else None
+
+
+class MemoryWatch:
+    """Memory and page-count budget of one browser, with leak detection.
+
+    Every check_every pages, the RSS of the browser's process tree is
+    sampled. page_done() returns the reason to recycle the browser once it
+    has served max_pages pages or its tree exceeds max_rss_mb. A fresh
+    browser starts from a clean heap, so the run stays under a fixed
+    ceiling however long it goes.
+
+    On recycling, the growth per 100 pages over the browser's lifetime is
+    estimated from the samples. Growth above leak_mb_per_100_pages is
+    reported as a suspected leak. The scraper's own RSS is tracked as
+    well, since recycling the browser cannot fix a leak in the scraper.
+    """
+
+    def __init__(
+        self,
+        max_rss_mb=1500.0,
+        max_pages=1000,
+        check_every=10,
+        leak_mb_per_100_pages=50.0,
+    ):
+        self.max_rss_mb = max_rss_mb
+        self.max_pages = max(1, max_pages)
+        self.check_every = max(1, check_every)
+        self.leak_mb_per_100_pages = leak_mb_per_100_pages
+        self.pid = None
+        self.pages = 0
+        self.samples = []
+        self.recycles = 0
+        self.peak_rss_mb = 0.0
+        self.scraper_rss_at_start = rss_mb(os.getpid()) if supported() else 0.0
+
+    @classmethod
+    def from_env(cls):
+        """Create a watch from UPWORK_BROWSER_* variables"""
+        return cls(
+            max_rss_mb=float(os.getenv("UPWORK_BROWSER_MAX_RSS_MB", "1500")),
+            max_pages=int(os.getenv("UPWORK_BROWSER_MAX_PAGES", "1000")),
+            check_every=int(os.getenv("UPWORK_MEMORY_CHECK_EVERY", "10")),
+            leak_mb_per_100_pages=float(
+                os.getenv("UPWORK_LEAK_MB_PER_100_PAGES", "50")
+            ),
+        )
+
+    def launched(self, pid):
+        """Start watching a newly launched browser"""
+        self.pid = pid
+        self.pages = 0
+        self.samples = []
+
+    def page_done(self):
+        """Count a served page; returns why the browser should be recycled, or None"""
+        self.pages += 1
+        if self.pages >= self.max_pages:
+            return f"it served {self.pages} pages"
+        if self.pid is None or self.pages % self.check_every:
+            return None
+
+        rss = tree_rss_mb(self.pid)
+        self.samples.append((self.pages, rss))
+        self.peak_rss_mb = max(self.peak_rss_mb, rss)
+        metrics = get_metrics()
+        metrics.gauge("browser.rss_mb", rss)
+        metrics.gauge("scraper.rss_mb", rss_mb(os.getpid()))
+        if rss > self.max_rss_mb:
+            return f"its processes use {rss:.0f} MB (budget {self.max_rss_mb:.0f} MB)"
+        return None
+
+    def growth_per_100_pages(self):
+        """Least-squares RSS growth in MB per 100 pages, skipping the first sample"""
+        samples = self.samples[1:]
+        if len(samples) < 3:
+            return None
+        mean_x = sum(x for x, _ in samples) / len(samples)
+        mean_y = sum(y for _, y in samples) / len(samples)
+        variance = sum((x - mean_x) ** 2 for x, _ in samples)
+        if not variance:
+            return None
+        covariance = sum((x - mean_x) * (y - mean_y) for x, y in samples)
+        return covariance / variance * 100
+
+    def recycling(self, reason):
+        """Report a browser about to be recycled"""
+        self.recycles += 1
+        get_metrics().incr("browser_recycles")
+        print(f"Recycling browser: {reason}")
+        growth = self.growth_per_100_pages()
+        if growth is not None and growth > self.leak_mb_per_100_pages:
+            get_metrics().incr("memory.leak_suspected")
+            print(
+                f"Possible memory leak: browser memory grew {growth:.0f} MB per "
+                f"100 pages over {self.pages} pages"
+            )
+
+    def report(self):
+        if not self.samples and not self.recycles:
+            return
+        scraper_rss = rss_mb(os.getpid()) if supported() else 0.0
+        print(
+            f"\nBrowser memory: peak {self.peak_rss_mb:.0f} MB, "
+            f"{self.recycles} recycles; scraper RSS "
+            f"{self.scraper_rss_at_start:.0f} -> {scraper_rss:.0f} MB"
+        )
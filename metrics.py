@@ -0,0 +1,259 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Latency histogram bucket upper bounds in seconds
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, float("inf"))
+
+
+class Histogram:
+    """Bucketed latency distribution of one stage"""
+
+    def __init__(self):
+        self.buckets = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.errors = 0
+
+    def observe(self, seconds):
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                break
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th quantile (max for the last)"""
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.buckets):
+            seen += count
+            if seen >= target and count:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self):
+        return {
+            "buckets": self.buckets,
+            "count": self.count,
+            "sum": self.sum,
+            "max": self.max,
+            "errors": self.errors,
+        }
+
+    def merge(self, data):
+        self.buckets = [a + b for a, b in zip(self.buckets, data["buckets"])]
+        self.count += data["count"]
+        self.sum += data["sum"]
+        self.max = max(self.max, data["max"])
+        self.errors += data["errors"]
+
+
+class Metrics:
+    """Stage timings, counters and sleep time collected over a run.
+
+    span(stage) times a block into the stage's latency histogram and counts
+    the blocks that raised. Deliberate waits go through sleep() or
+    add_sleep() so a run can tell time spent sleeping from time spent working.
+    Deliberate sleeps are multiplied by sleep_scale (UPWORK_SLEEP_SCALE), which
+    benchmarks turn down to measure the scraper rather than its pauses.
+    """
+
+    def __init__(self, sleep_scale=None):
+        if sleep_scale is None:
+            sleep_scale = float(os.getenv("UPWORK_SLEEP_SCALE", "1"))
+        self.sleep_scale = sleep_scale
+        self.started = time.monotonic()
+        self.stages = {}
+        self.counters = {}
+        self.sleeps = {}
+        self.gauges = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, stage):
+        started = time.monotonic()
+        failed = False
+        try:
+            yield
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            self.observe(stage, time.monotonic() - started, failed)
+
+    def observe(self, stage, seconds, failed=False):
+        with self._lock:
+            histogram = self.stages.setdefault(stage, Histogram())
+            histogram.observe(seconds)
+            if failed:
+                histogram.errors += 1
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def gauge(self, name, value):
+        """Record the current value of a level, e.g. memory use; the peak is kept"""
+        with self._lock:
+            peak = self.gauges.get(name, {}).get("peak", value)
+            self.gauges[name] = {"last": value, "peak": max(peak, value)}
+
+    def add_sleep(self, reason, seconds):
+        with self._lock:
+            self.sleeps[reason] = self.sleeps.get(reason, 0.0) + seconds
+
+    def sleep(self, seconds, reason):
+        """time.sleep() that is accounted as sleeping"""
+        seconds *= self.sleep_scale
+        self.add_sleep(reason, seconds)
+        time.sleep(seconds)
+
+    async def sleep_async(self, seconds, reason):
+        """asyncio.sleep() that is accounted as sleeping"""
+        seconds *= self.sleep_scale
+        self.add_sleep(reason, seconds)
+        await asyncio.sleep(seconds)
+
+    def snapshot(self):
+        """Return the collected metrics as a JSON-serializable dict"""
+        with self._lock:
+            return {
+                "wall_seconds": time.monotonic() - self.started,
+                "stages": {
+                    stage: histogram.to_dict()
+                    for stage, histogram in self.stages.items()
+                },
+                "counters": dict(self.counters),
+                "sleep_seconds": dict(self.sleeps),
+                "gauges": {name: dict(value) for name, value in self.gauges.items()},
+            }
+
+    def merge(self, snapshot):
+        """Add another process's snapshot, e.g. from a sharded crawl worker"""
+        with self._lock:
+            for stage, data in snapshot["stages"].items():
+                self.stages.setdefault(stage, Histogram()).merge(data)
+            for name, value in snapshot["counters"].items():
+                self.counters[name] = self.counters.get(name, 0) + value
+            for reason, seconds in snapshot["sleep_seconds"].items():
+                self.sleeps[reason] = self.sleeps.get(reason, 0.0) + seconds
+            for name, value in snapshot.get("gauges", {}).items():
+                # Levels of different processes add up
+                mine = self.gauges.setdefault(name, {"last": 0, "peak": 0})
+                mine["last"] += value["last"]
+                mine["peak"] += value["peak"]
+
+    def to_prometheus(self):
+        """Render the metrics in the Prometheus text exposition format"""
+        snapshot = self.snapshot()
+        lines = [
+            "# TYPE upwork_stage_seconds histogram",
+        ]
+        for stage, data in sorted(snapshot["stages"].items()):
+            cumulative = 0
+            for bound, count in zip(BUCKETS, data["buckets"]):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                lines.append(
+                    f'upwork_stage_seconds_bucket{{stage="{stage}",le="{le}"}} {cumulative}'
+                )
+            lines.append(f'upwork_stage_seconds_sum{{stage="{stage}"}} {data["sum"]}')
+            lines.append(
+                f'upwork_stage_seconds_count{{stage="{stage}"}} {data["count"]}'
+            )
+        lines.append("# TYPE upwork_stage_errors_total counter")
+        for stage, data in sorted(snapshot["stages"].items()):
+            lines.append(
+                f'upwork_stage_errors_total{{stage="{stage}"}} {data["errors"]}'
+            )
+        lines.append("# TYPE upwork_events_total counter")
+        for name, value in sorted(snapshot["counters"].items()):
+            lines.append(f'upwork_events_total{{event="{name}"}} {value}')
+        lines.append("# TYPE upwork_sleep_seconds_total counter")
+        for reason, seconds in sorted(snapshot["sleep_seconds"].items()):
+            lines.append(f'upwork_sleep_seconds_total{{reason="{reason}"}} {seconds}')
+        lines.append("# TYPE upwork_gauge gauge")
+        for name, value in sorted(snapshot["gauges"].items()):
+            lines.append(f'upwork_gauge{{name="{name}"}} {value["last"]}')
+            lines.append(f'upwork_gauge{{name="{name}_peak"}} {value["peak"]}')
+        lines.append("# TYPE upwork_wall_seconds gauge")
+        lines.append(f"upwork_wall_seconds {snapshot['wall_seconds']}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, prefix):
+        """Write {prefix}.json and {prefix}.prom; returns the JSON filename"""
+        with open(f"{prefix}.json", "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f, indent=2)
+        with open(f"{prefix}.prom", "w", encoding="utf-8") as f:
+            f.write(self.to_prometheus())
+        return f"{prefix}.json"
+
+    def report(self):
+        """Print where the run's time went"""
+        snapshot = self.snapshot()
+        wall = snapshot["wall_seconds"]
+        print(f"\nRun time: {wall:.0f}s")
+
+        if self.stages:
+            print(
+                f"{'stage':<28}{'count':>7}{'errors':>8}{'total s':>10}"
+                f"{'mean s':>9}{'p50 s':>8}{'p95 s':>8}{'max s':>8}"
+            )
+            with self._lock:
+                stages = sorted(
+                    self.stages.items(), key=lambda item: item[1].sum, reverse=True
+                )
+                for stage, histogram in stages:
+                    print(
+                        f"{stage:<28}{histogram.count:>7}{histogram.errors:>8}"
+                        f"{histogram.sum:>10.1f}{histogram.sum / histogram.count:>9.2f}"
+                        f"{histogram.quantile(0.5):>8.2f}{histogram.quantile(0.95):>8.2f}"
+                        f"{histogram.max:>8.2f}"
+                    )
+
+        slept = sum(snapshot["sleep_seconds"].values())
+        if slept:
+            details = ", ".join(
+                f"{reason} {seconds:.0f}s"
+                for reason, seconds in sorted(
+                    snapshot["sleep_seconds"].items(), key=lambda item: -item[1]
+                )
+            )
+            # Summed over threads and workers, so it can exceed the run time
+            print(f"Sleeping: {slept:.0f}s in total ({details})")
+        if snapshot["counters"]:
+            print(
+                "Events: "
+                + ", ".join(
+                    f"{name}={value}"
+                    for name, value in sorted(snapshot["counters"].items())
+                )
+            )
+        if snapshot["gauges"]:
+            print(
+                "Levels (last/peak): "
+                + ", ".join(
+                    f"{name}={value['last']:.0f}/{value['peak']:.0f}"
+                    for name, value in sorted(snapshot["gauges"].items())
+                )
+            )
+
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics():
+    """Return the process-wide metrics shared by every scraper"""
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = Metrics()
+        return _metrics
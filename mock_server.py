@@ -0,0 +1,287 @@
+import argparse
+import json
+import os
+import random
+import threading
+import time
+from html import escape
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+LISTING_PAGE = """<!DOCTYPE html>
+<html><head><title>Job search</title><link rel="stylesheet" href="/static/app.css"></head>
+<body><section class="job-tile-list">{tiles}</section></body></html>
+"""
+
+JOB_TILE = """<article class="job-tile"><h2><a class="air3-link" href="{href}">{title}</a></h2></article>"""
+
+JOB_PAGE = """<!DOCTYPE html>
+<html><head><title>{title}</title><link rel="stylesheet" href="/static/app.css"></head>
+<body>
+<div class="job-details-card"><header><h4 class="flex-1">{title}</h4></header>
+<p class="text-body-sm">{description}</p></div>
+<ul class="cfe-ui-job-about-client"><li><strong>{country}</strong><div><span>{city}</span> <span>10:00 AM</span></div></li></ul>
+{in_progress}
+<img src="/static/banner.png">
+</body></html>
+"""
+
+# The in-progress list is only loaded and rendered client-side, after the
+# section is expanded, like on the live site
+IN_PROGRESS_SECTION = """<button class="jobs-in-progress-title">Jobs in progress ({count})</button>
+<div class="in-progress-list"></div>
+<script>
+document.querySelector(".jobs-in-progress-title").addEventListener("click", async () => {{
+  const response = await fetch("{api_url}");
+  const data = await response.json();
+  setTimeout(() => {{
+    const links = data.jobs.map(
+      (job) => `<a class="js-job-link" href="${{job.url}}">${{job.title}}</a>`
+    );
+    document.querySelector(".in-progress-list").innerHTML =
+      `<section class="air3-card-section">${{links.join("")}}</section>`;
+  }}, {render_delay_ms});
+}});
+</script>
+"""
+
+CAPTCHA_PAGE = """<!DOCTYPE html>
+<html><body><div class="captcha-challenge">Please verify you are a human</div></body></html>
+"""
+
+COUNTRIES = [
+    ("United States", "New York"),
+    ("United Kingdom", "London"),
+    ("Germany", "Berlin"),
+    ("Israel", "Tel Aviv"),
+    ("Canada", "Toronto"),
+]
+
+
+class MockUpworkServer:
+    """Local stand-in for the Upwork pages the scraper visits.
+
+    Serves search listings, parent job pages with an in-progress section
+    that is fetched as JSON and rendered client-side, and in-progress job
+    pages. Latency, server errors
+    and CAPTCHA pages are injected at the configured rates. Pages saved from
+    the live site can be served instead by putting them in fixtures_dir as
+    listing.html, parent.html and in_progress.html; they are used as is.
+    """
+
+    def __init__(
+        self,
+        jobs=25,
+        in_progress_per_job=3,
+        latency=0.05,
+        error_rate=0.0,
+        captcha_rate=0.0,
+        render_delay=0.05,
+        fixtures_dir=None,
+        host="127.0.0.1",
+        port=0,
+        seed=0,
+    ):
+        self.jobs = jobs
+        self.in_progress_per_job = in_progress_per_job
+        self.latency = latency
+        self.error_rate = error_rate
+        self.captcha_rate = captcha_rate
+        self.render_delay = render_delay
+        self.fixtures = self._load_fixtures(fixtures_dir)
+        self.requests = {}
+        self.errors_served = 0
+        self.captchas_served = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def serve_forever(self):
+        """Serve until interrupted"""
+        self.start()
+        try:
+            self._thread.join()
+        except KeyboardInterrupt:
+            self.stop()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    @staticmethod
+    def _load_fixtures(fixtures_dir):
+        fixtures = {}
+        for name in ("listing", "parent", "in_progress"):
+            path = os.path.join(fixtures_dir or "", f"{name}.html")
+            if fixtures_dir and os.path.exists(path):
+                with open(path, encoding="utf-8") as f:
+                    fixtures[name] = f.read()
+        return fixtures
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server._handle(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def _count(self, kind):
+        with self._lock:
+            self.requests[kind] = self.requests.get(kind, 0) + 1
+
+    def _roll(self, rate):
+        with self._lock:
+            return self._random.random() < rate
+
+    def _handle(self, request):
+        parsed = urlparse(request.path)
+        path = parsed.path
+
+        if path.startswith("/static/"):
+            self._count("static")
+            return self._send(request, 200, "", "text/css")
+
+        if path.startswith("/nx/search/jobs"):
+            kind = "listing"
+        elif path.startswith("/api/jobs/~0") and path.endswith("/in-progress"):
+            kind = "in_progress_list"
+        elif path.startswith("/jobs/~0"):
+            kind = "parent"
+        elif path.startswith("/jobs/~1"):
+            kind = "in_progress"
+        else:
+            self._count("not_found")
+            return self._send(request, 404, "Not found")
+        self._count(kind)
+
+        if self.latency:
+            time.sleep(self._random.uniform(0.5, 1.5) * self.latency)
+        if self._roll(self.error_rate):
+            self.errors_served += 1
+            return self._send(request, 503, "Service unavailable")
+        if self._roll(self.captcha_rate):
+            self.captchas_served += 1
+            return self._send(request, 200, CAPTCHA_PAGE)
+
+        if kind == "listing":
+            body = self._listing(parse_qs(parsed.query))
+        elif kind == "parent":
+            body = self._parent(path)
+        elif kind == "in_progress_list":
+            return self._send(
+                request, 200, self._in_progress_list(path), "application/json"
+            )
+        else:
+            body = self._in_progress(path)
+        self._send(request, 200, body)
+
+    def _send(self, request, status, body, content_type="text/html"):
+        data = body.encode("utf-8")
+        request.send_response(status)
+        request.send_header("Content-Type", f"{content_type}; charset=utf-8")
+        request.send_header("Content-Length", str(len(data)))
+        request.end_headers()
+        request.wfile.write(data)
+
+    def _listing(self, query):
+        if "listing" in self.fixtures:
+            return self.fixtures["listing"]
+        page_number = int(query.get("page", ["1"])[0])
+        per_page = int(query.get("per_page", ["10"])[0])
+        first = (page_number - 1) * per_page
+        tiles = "".join(
+            JOB_TILE.format(href=f"/jobs/~0{i:06d}", title=f"Job {i}")
+            for i in range(first, min(first + per_page, self.jobs))
+        )
+        return LISTING_PAGE.format(tiles=tiles)
+
+    def _parent(self, path):
+        if "parent" in self.fixtures:
+            return self.fixtures["parent"]
+        job_id = path.rsplit("~0", 1)[-1]
+        in_progress = ""
+        if self.in_progress_per_job:
+            in_progress = IN_PROGRESS_SECTION.format(
+                count=self.in_progress_per_job,
+                api_url=f"/api/jobs/~0{job_id}/in-progress",
+                render_delay_ms=int(self.render_delay * 1000),
+            )
+        return self._job_page(job_id, f"Parent job {job_id}", in_progress)
+
+    def _in_progress_list(self, path):
+        job_id = path.split("~0", 1)[1].split("/", 1)[0]
+        jobs = [
+            {"url": f"/jobs/~1{job_id}{k:02d}", "title": f"In-progress job {k}"}
+            for k in range(self.in_progress_per_job)
+        ]
+        return json.dumps({"jobs": jobs})
+
+    def _in_progress(self, path):
+        if "in_progress" in self.fixtures:
+            return self.fixtures["in_progress"]
+        job_id = path.rsplit("~1", 1)[-1]
+        return self._job_page(job_id, f"In-progress job {job_id}", "")
+
+    @staticmethod
+    def _job_page(job_id, title, in_progress):
+        country, city = COUNTRIES[int(job_id) % len(COUNTRIES)]
+        description = escape(
+            f"{title}: build and maintain a data pipeline. " * 5
+        ).strip()
+        return JOB_PAGE.format(
+            title=escape(title),
+            description=description,
+            country=country,
+            city=city,
+            in_progress=in_progress,
+        )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Serve mock Upwork pages")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--jobs", type=int, default=25)
+    parser.add_argument("--in-progress", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--captcha-rate", type=float, default=0.0)
+    parser.add_argument("--fixtures-dir")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    server = MockUpworkServer(
+        jobs=args.jobs,
+        in_progress_per_job=args.in_progress,
+        latency=args.latency,
+        error_rate=args.error_rate,
+        captcha_rate=args.captcha_rate,
+        fixtures_dir=args.fixtures_dir,
+        port=args.port,
+    )
+    print(f"Serving mock Upwork on {server.url} (UPWORK_BASE_URL={server.url})")
+    server.serve_forever()
@@ -1,168 +1,168 @@
-from playwright.sync_api import sync_playwright
-import time
-import random
+from browser_pool import use_pool, navigate, check_page
+from config import BASE_URL, absolute_url
+from extraction import (
+    JOB_DESCRIPTION,
+    JOB_TITLE,
+    LISTING,
+    PARENT_JOB,
+    extract,
+    job_location,
+)
+from http_fetch import get_http_fetcher
+from metrics import get_metrics
+from retry import RetryPolicy, TransientError
+from playwright.sync_api import TimeoutError as PlaywrightTimeoutError
 from datetime import datetime
+from urllib.parse import urlencode, quote
+
+SEARCH_BASE_URL = f"{BASE_URL}/nx/search/jobs/"
+SEARCH_PARAMS = {
+    "amount": "5000-",
+    "category2_uid": "531770282580668418",
+    "hourly_rate": "50-",
+    "location": "Europe,Northern America,Israel,United Kingdom",
+    "sort": "recency",
+    "t": "0,1",
+}
+
+
+def search_url(page_number=1, per_page=10, params=None):
+    """Build the job search URL for one page of results"""
+    params = dict(params or SEARCH_PARAMS, per_page=per_page)
+    if page_number > 1:
+        params["page"] = page_number
+    return f"{SEARCH_BASE_URL}?{urlencode(params, safe=',', quote_via=quote)}"
+
+
+def scrape_listing_page(page, url):
+    """Returns the job links of one search results page"""
+    response, security_check = navigate(page, url)
+    check_page(page, response, security_check, url, "captcha_screenshot.png")
+
+    print("Waiting for job listings to load...")
+    with get_metrics().span("wait.listing"):
+        page.wait_for_selector(".air3-link", timeout=60000)
+
+    return extract(page, LISTING)["links"]
+
+
+def iter_parent_job_links(
+    cookies=None, pool=None, per_page=10, max_pages=5, stop_at=None, params=None
+):
+    """Yields job listing links page by page, as soon as each page is loaded.
+
+    Stops after max_pages, at the first short or empty page, or at the first
+    link for which stop_at(link) is true; with sort=recency everything after
+    an already-seen job has been seen too.
+    """
+    with use_pool(pool, cookies) as pool:
+        for page_number in range(1, max_pages + 1):
+            url = search_url(page_number, per_page, params)
+            print(f"\nGetting job list page {page_number}...")
+
+            def load(attempt):
+                with pool.page() as page, get_metrics().span("discovery.page"):
+                    return scrape_listing_page(page, url)
+
+            # A slow page is retried, not taken for the end of the results;
+            # a short page already marks that
+            try:
+                links = RetryPolicy.from_env().call(load, "listing")
+            except Exception as e:
+                print(f"Error occurred: {str(e)}")
+                raise
+
+            print(f"Found {len(links)} jobs on page {page_number}")
+            for link in links:
+                if not link:
+                    continue
+                if stop_at and stop_at(link):
+                    print(f"Reached already scraped job {link}, stopping discovery")
+                    return
+                yield link
+
+            if len(links) < per_page:
+                return
+
+
+def scrape_parent_job_links(cookies=None, pool=None, **kwargs):
+    """Scrapes job listing links from all result pages"""
+    return list(iter_parent_job_links(cookies, pool, **kwargs))
 
 
-def scrape_parent_job_links(cookies=None):
-    """Scrapes initial job listing links"""
-    with sync_playwright() as p:
-        browser = p.chromium.launch(
-            headless=True,
-            args=[
-                "--disable-blink-features=AutomationControlled",
-                "--no-sandbox",
-                "--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-            ],
-        )
-        context = browser.new_context()
-        page = context.new_page()
-
-        try:
-            if cookies:
-                context.add_cookies(cookies)
-
-            time.sleep(random.uniform(1.0, 2.0))
-
-            response = page.goto(
-                "https://www.upwork.com/nx/search/jobs/?amount=5000-&category2_uid=531770282580668418&hourly_rate=50-&location=Europe,Northern%20America,Israel,United%20Kingdom&per_page=10&sort=recency&t=0,1"
-            )
+def get_parent_job_details(page, link):
+    """Read the main job details from the page in one evaluate call.
 
-            if response.status != 200:
-                print(f"Warning: Page returned status code {response.status}")
+    Raises MissingFieldsError when the title or description is missing.
+    """
+    return extract(page, PARENT_JOB).require(absolute_url(link))
 
-            if page.query_selector("div[class*='captcha']") or page.query_selector(
-                "div[class*='security-check']"
-            ):
-                print("Warning: Detected possible CAPTCHA or security check page")
-                page.screenshot(path="captcha_screenshot.png")
-                print("Screenshot saved as captcha_screenshot.png")
-                raise Exception("Security check or CAPTCHA detected")
 
-            print("Waiting for job listings to load...")
-            page.wait_for_selector(".air3-link", timeout=60000)
-            time.sleep(random.uniform(1.0, 2.0))
+def scrape_parent_job(link, cookies=None, max_retries=3, pool=None):
+    """Scrapes a single parent job and its in-progress links with retries"""
+    fetcher = get_http_fetcher()
+    job = fetcher.fetch_parent_job(link) if fetcher else None
+    if job:
+        print(f"Fetched {link} over HTTP")
+        if job["in_progress_links"]:
+            print(f"Found {len(job['in_progress_links'])} in-progress links")
+        return dict(
+            job,
+            url=absolute_url(link),
+            timestamp=datetime.now().isoformat(),
+            source="upwork.com",
+        )
 
-            job_links = page.query_selector_all("a.air3-link")
-            links = [link.get_attribute("href") for link in job_links]
+    url = absolute_url(link)
+    with use_pool(pool, cookies) as pool, pool.page() as page:
+
+        def load(attempt):
+            response, security_check = navigate(page, url)
+            check_page(
+                page,
+                response,
+                security_check,
+                url,
+                f"captcha_details_screenshot_{attempt}.png",
+            )
 
-            return links
+            print("Waiting for job details to load...")
+            with get_metrics().span("wait.job_details"):
+                page.wait_for_selector(JOB_TITLE, timeout=60000)
+            try:
+                with get_metrics().span("wait.description"):
+                    page.wait_for_selector(JOB_DESCRIPTION, timeout=30000)
+            except PlaywrightTimeoutError:
+                # Unlike an in-progress job, a parent without a description
+                # would be lost for good, so it gets another attempt
+                raise TransientError(f"Description not rendered on {url}")
+
+            details = get_parent_job_details(page, link)
+
+            # Import here to avoid circular import
+            from in_progress_jobs import find_in_progress_links
+
+            # Find in-progress links with retries
+            in_progress_links = []
+            if details["has_in_progress"]:
+                with get_metrics().span("find_in_progress_links"):
+                    in_progress_links = find_in_progress_links(page, max_retries=3)
+            else:
+                print("No in-progress button found")
 
-        except Exception as e:
-            print(f"Error occurred: {str(e)}")
-            raise
-        finally:
-            browser.close()
+            job_data = {
+                "url": url,
+                "title": details["title"],
+                "description": details["description"],
+                "location": job_location(details),
+                "timestamp": datetime.now().isoformat(),
+                "source": "upwork.com",
+                "in_progress_links": in_progress_links,
+            }
 
+            if in_progress_links:
+                print(f"Found {len(in_progress_links)} in-progress links")
 
-def get_parent_job_details(page, link):
-    """Extract main job details from the page"""
-    title_element = page.query_selector(".job-details-card .flex-1")
-    description_element = page.query_selector("p.text-body-sm")
-    country_element = page.query_selector(
-        ".cfe-ui-job-about-client li:nth-of-type(1) strong"
-    )
-    location_details_element = page.query_selector(
-        ".cfe-ui-job-about-client li:nth-of-type(1) span:first-child"
-    )
-
-    title = title_element.inner_text() if title_element else "Title not found"
-    description = (
-        description_element.inner_text()
-        if description_element
-        else "Description not found"
-    )
-    country = country_element.inner_text() if country_element else "Country not found"
-    location_details = (
-        location_details_element.inner_text() if location_details_element else ""
-    )
-
-    location = f"{country} + {location_details}" if location_details else country
-
-    return title, description, location
-
-
-def scrape_parent_job(link, cookies=None, max_retries=3):
-    """Scrapes a single parent job and its in-progress links with retries"""
-    with sync_playwright() as p:
-        browser = p.chromium.launch(
-            headless=True,
-            args=[
-                "--disable-blink-features=AutomationControlled",
-                "--no-sandbox",
-                "--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-            ],
-        )
-        context = browser.new_context()
-        page = context.new_page()
-
-        try:
-            if cookies:
-                context.add_cookies(cookies)
-
-            time.sleep(random.uniform(1.0, 2.0))
-
-            for attempt in range(max_retries):
-                try:
-                    response = page.goto(f"https://www.upwork.com{link}")
-                    if response.status != 200:
-                        print(f"Warning: Page returned status code {response.status}")
-                        continue
-
-                    if page.query_selector(
-                        "div[class*='captcha']"
-                    ) or page.query_selector("div[class*='security-check']"):
-                        print(
-                            "Warning: Detected possible CAPTCHA or security check page"
-                        )
-                        page.screenshot(
-                            path=f"captcha_details_screenshot_{attempt}.png"
-                        )
-                        print(
-                            f"Screenshot saved as captcha_details_screenshot_{attempt}.png"
-                        )
-                        if attempt < max_retries - 1:
-                            time.sleep(random.uniform(5.0, 10.0))
-                            continue
-                        raise Exception("Security check or CAPTCHA detected")
-
-                    print("Waiting for job details to load...")
-                    page.wait_for_selector(".job-details-card .flex-1", timeout=60000)
-                    time.sleep(random.uniform(1.0, 2.0))
-
-                    title, description, location = get_parent_job_details(page, link)
-
-                    # Import here to avoid circular import
-                    from in_progress_jobs import find_in_progress_links
-
-                    # Find in-progress links with retries
-                    in_progress_links = find_in_progress_links(page, max_retries=3)
+            return job_data
 
-                    job_data = {
-                        "url": f"https://www.upwork.com{link}",
-                        "title": title,
-                        "description": description,
-                        "location": location,
-                        "timestamp": datetime.now().isoformat(),
-                        "source": "upwork.com",
-                        "in_progress_links": (
-                            " ; ".join(in_progress_links) if in_progress_links else ""
-                        ),
-                        "in_progress_titles": "",
-                        "in_progress_descriptions": "",
-                    }
-
-                    if in_progress_links:
-                        print(f"Found {len(in_progress_links)} in-progress links")
-
-                    return job_data
-
-                except Exception as e:
-                    print(f"Attempt {attempt + 1} failed: {str(e)}")
-                    if attempt < max_retries - 1:
-                        time.sleep(random.uniform(5.0, 10.0))
-                    else:
-                        raise
-
-        finally:
-            browser.close()
+        return RetryPolicy.from_env(max_retries).call(load, "parent_job")
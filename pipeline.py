@@ -0,0 +1,159 @@
+import queue
+import threading
+from browser_pool import BrowserPool
+from config import job_key
+from frontier import PARENT, IN_PROGRESS
+from in_progress_jobs import scrape_in_progress_job
+from metrics import get_metrics
+
+
+def record_parent_job(link, job_data, store, frontier):
+    """Store a scraped parent job and return its in-progress links still to fetch"""
+    if not job_data:
+        frontier.mark_failed(PARENT, link, error="No job data")
+        print(f"Failed to get parent job details for {link}")
+        return []
+
+    store.save_parent(job_data)
+    frontier.add(IN_PROGRESS, job_data["in_progress_links"], job_data["url"])
+    frontier.mark_done(PARENT, link)
+    return [
+        in_progress_link
+        for in_progress_link in job_data["in_progress_links"]
+        if frontier.is_pending(IN_PROGRESS, in_progress_link, job_data["url"])
+    ]
+
+
+def record_in_progress_job(parent_url, link, title, description, store, frontier):
+    """Store an in-progress job's details, or mark it failed when they are missing"""
+    if title and description:
+        store.save_in_progress_details(parent_url, link, title, description)
+        frontier.mark_done(IN_PROGRESS, link, parent_url)
+        print(f"Updated details for {link}")
+    else:
+        frontier.mark_failed(IN_PROGRESS, link, parent_url, "Details not found")
+        print(f"Failed to get valid details for {link}")
+
+
+def group_by_job(entries):
+    """Group (link, parent_url) pairs by job: {job_key: [(link, parent_url)]}"""
+    groups = {}
+    for link, parent_url in entries:
+        groups.setdefault(job_key(link), []).append((link, parent_url))
+    return groups
+
+
+def fetch_in_progress_details(link, cookies, store, pool):
+    """Return (title, description) of an in-progress job, fetching each job once"""
+    cached = store.cached_details(link)
+    if cached:
+        get_metrics().incr("details_cache.hits")
+        print(f"Reusing details fetched earlier for {link}")
+        return cached
+
+    # Get job details with retries and timeouts
+    with get_metrics().span("in_progress_job"):
+        title, description = scrape_in_progress_job(link, cookies, pool)
+    store.cache_details(link, title, description)
+    return title, description
+
+
+def process_in_progress_group(entries, cookies, store, frontier, pool):
+    """Fetch one in-progress job and record it for every parent listing it.
+
+    entries are the (link, parent_url) pairs that refer to the same job.
+    """
+    link = entries[0][0]
+    try:
+        title, description = fetch_in_progress_details(link, cookies, store, pool)
+    except Exception as e:
+        for link, parent_url in entries:
+            frontier.mark_failed(IN_PROGRESS, link, parent_url, e)
+        print(f"Error processing in-progress job {link}: {e}")
+        return
+
+    for link, parent_url in entries:
+        record_in_progress_job(parent_url, link, title, description, store, frontier)
+
+
+class InProgressPipeline:
+    """Detail workers fetching in-progress jobs while parent jobs are still scraped.
+
+    Every worker thread runs its own Playwright instance and browser pool,
+    since sync Playwright objects cannot be shared between threads. Page
+    loads stay paced by the process-wide rate limiter.
+
+    A job listed under several parents is queued once; parents submitting
+    it while it is still queued are recorded along with the first one.
+    """
+
+    def __init__(self, cookies, store, frontier, workers=1):
+        self.cookies = cookies
+        self.store = store
+        self.frontier = frontier
+        self.workers = max(1, workers)
+        self._queue = queue.Queue()
+        self._threads = []
+        self._submitted = set()
+        self._waiting = {}
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self._discard_queued()
+        self.close()
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(
+                target=self._worker, name=f"in-progress-worker-{i + 1}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, parent_url, link):
+        """Queue an in-progress job; each (parent, link) pair is queued once"""
+        key = job_key(link)
+        with self._lock:
+            if (parent_url, link) in self._submitted:
+                return
+            self._submitted.add((parent_url, link))
+            if key in self._waiting:
+                self._waiting[key].append((link, parent_url))
+                return
+            self._waiting[key] = [(link, parent_url)]
+        self._queue.put(key)
+
+    def close(self):
+        """Wait until every queued job is processed, then stop the workers"""
+        if self._queue.qsize():
+            print(f"\nWaiting for {self._queue.qsize()} queued in-progress jobs...")
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def _discard_queued(self):
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                return
+
+    def _worker(self):
+        with BrowserPool.from_env(self.cookies) as pool:
+            while True:
+                key = self._queue.get()
+                if key is None:
+                    return
+                with self._lock:
+                    entries = self._waiting.pop(key)
+                print(f"Processing in-progress job {entries[0][0]}")
+                process_in_progress_group(
+                    entries, self.cookies, self.store, self.frontier, pool
+                )
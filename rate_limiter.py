@@ -0,0 +1,136 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from metrics import get_metrics
+
+THROTTLE_STATUSES = {403, 429, 503}
+
+
+class AdaptiveRateLimiter:
+    """Token bucket whose refill rate adapts to how the site is responding.
+
+    The rate grows additively while responses are healthy and is cut
+    multiplicatively (AIMD) on throttling signals: 403/429/503 responses,
+    CAPTCHA pages and responses slower than slow_response_seconds.
+    """
+
+    def __init__(
+        self,
+        rate=0.2,
+        min_rate=0.02,
+        max_rate=1.0,
+        burst=1,
+        increase=0.02,
+        decrease=0.5,
+        slow_response_seconds=15.0,
+        jitter=0.2,
+    ):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.burst = burst
+        self.increase = increase
+        self.decrease = decrease
+        self.slow_response_seconds = slow_response_seconds
+        self.jitter = jitter
+        self.requests = 0
+        self.throttle_events = 0
+        self.seconds_waited = 0.0
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """Create a limiter configured from UPWORK_RATE_* environment variables"""
+        return cls(
+            rate=float(os.getenv("UPWORK_RATE", "0.2")),
+            min_rate=float(os.getenv("UPWORK_RATE_MIN", "0.02")),
+            max_rate=float(os.getenv("UPWORK_RATE_MAX", "1.0")),
+            slow_response_seconds=float(
+                os.getenv("UPWORK_SLOW_RESPONSE_SECONDS", "15")
+            ),
+        )
+
+    def _reserve(self):
+        """Take a token and return how long the caller must wait for it"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+            self._tokens -= 1
+            self.requests += 1
+            if self._tokens >= 0:
+                return 0.0
+            delay = -self._tokens / self.rate
+            delay *= random.uniform(1 - self.jitter, 1 + self.jitter)
+            self.seconds_waited += delay
+            return delay
+
+    def wait(self):
+        """Block until the next request may be sent"""
+        delay = self._reserve()
+        if delay:
+            get_metrics().add_sleep("rate_limit", delay)
+            time.sleep(delay)
+
+    async def wait_async(self):
+        """Asyncio counterpart of wait()"""
+        delay = self._reserve()
+        if delay:
+            get_metrics().add_sleep("rate_limit", delay)
+            await asyncio.sleep(delay)
+
+    def record(self, status=None, latency=None, captcha=False):
+        """Feed the outcome of a request back into the rate"""
+        metrics = get_metrics()
+        if status is not None:
+            metrics.incr(f"responses.{status}")
+        if captcha:
+            metrics.incr("captcha_pages")
+        throttled = (
+            captcha
+            or status in THROTTLE_STATUSES
+            or (latency is not None and latency > self.slow_response_seconds)
+        )
+        with self._lock:
+            if throttled:
+                self.throttle_events += 1
+                self.rate = max(self.min_rate, self.rate * self.decrease)
+                # Drop any saved-up burst so the slowdown applies right away
+                self._tokens = min(self._tokens, 0)
+            elif status is not None and status < 400:
+                self.rate = min(self.max_rate, self.rate + self.increase)
+            else:
+                return
+
+        if throttled:
+            print(
+                f"Throttling detected (status={status}, captcha={captcha}), "
+                f"slowing down to {60 * self.rate:.1f} requests/min"
+            )
+
+    def report(self):
+        """Print how the limiter behaved over the run"""
+        print(
+            f"\nRate limiter: {self.requests} requests, {self.seconds_waited:.0f}s "
+            f"spent waiting, {self.throttle_events} throttling events, "
+            f"final rate {60 * self.rate:.1f} requests/min"
+        )
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    """Return the process-wide limiter shared by every scraper"""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = AdaptiveRateLimiter.from_env()
+        return _limiter
@@ -0,0 +1,162 @@
+import os
+import re
+import time
+from extraction import IN_PROGRESS_LINKS
+from http_fetch import parse_job_page
+from metrics import get_metrics
+from retry import TransientError
+
+# XHR/fetch calls whose JSON carries the in-progress list of a parent job
+IN_PROGRESS_RESPONSE = re.compile(
+    os.getenv("UPWORK_IN_PROGRESS_RESPONSE_PATTERN", r"in-?progress"), re.IGNORECASE
+)
+# How long the list gets to arrive, as a response or rendered
+IN_PROGRESS_TIMEOUT = 30
+# How often to look for whichever of the two came first
+IN_PROGRESS_POLL_MS = 100
+
+JOB_LINK = re.compile(r"^(?:https?://[^/]+)?/jobs/\S*~[0-9A-Za-z]+/?$")
+CIPHERTEXT = re.compile(r"^~[0-9A-Za-z]+$")
+
+
+def is_in_progress_response(response):
+    return response.request.resource_type in (
+        "xhr",
+        "fetch",
+    ) and IN_PROGRESS_RESPONSE.search(response.url)
+
+
+def _item_link(item):
+    """The job link among an object's own fields, or None"""
+    ciphertext = item.get("ciphertext")
+    if isinstance(ciphertext, str) and CIPHERTEXT.match(ciphertext):
+        return f"/jobs/{ciphertext}"
+    for value in item.values():
+        if isinstance(value, str) and JOB_LINK.match(value):
+            return value
+    return None
+
+
+def links_from_payload(payload):
+    """Job links of the list items in a JSON payload, in order and without repeats.
+
+    The list is the array whose objects carry the most job links in their
+    own fields, either as a job URL or a ciphertext id ("~01..."). Links
+    elsewhere in the payload, such as the parent job's own, are left out.
+    """
+    best = []
+
+    def walk(value):
+        nonlocal best
+        if isinstance(value, dict):
+            for child in value.values():
+                walk(child)
+        elif isinstance(value, list):
+            links = [_item_link(item) for item in value if isinstance(item, dict)]
+            links = list(dict.fromkeys(link for link in links if link))
+            if len(links) > len(best):
+                best = links
+            for child in value:
+                walk(child)
+
+    walk(payload)
+    return best
+
+
+def links_from_response(response):
+    """Job links from an in-progress list response, or None"""
+    try:
+        links = links_from_payload(response.json())
+    except Exception:
+        return None
+    if not links:
+        return None
+    get_metrics().incr("readiness.in_progress_response")
+    return links
+
+
+async def links_from_response_async(response):
+    try:
+        links = links_from_payload(await response.json())
+    except Exception:
+        return None
+    if not links:
+        return None
+    get_metrics().incr("readiness.in_progress_response")
+    return links
+
+
+def expand_in_progress(page, button):
+    """Click the in-progress button and return the links of the list it loads.
+
+    Whichever comes first wins: the list's XHR response, whose links are
+    returned without waiting for the list to render, or the rendered list,
+    in which case None is returned and the caller reads the page. Raises
+    TransientError when neither arrives within IN_PROGRESS_TIMEOUT seconds.
+    """
+    responses = []
+
+    def on_response(response):
+        if is_in_progress_response(response):
+            responses.append(response)
+
+    page.on("response", on_response)
+    try:
+        with get_metrics().span("wait.in_progress_links"):
+            button.click()
+            deadline = time.monotonic() + IN_PROGRESS_TIMEOUT
+            while True:
+                while responses:
+                    links = links_from_response(responses.pop(0))
+                    if links:
+                        return links
+                if page.query_selector(IN_PROGRESS_LINKS):
+                    return None
+                if time.monotonic() >= deadline:
+                    raise TransientError("In-progress list did not load")
+                # Lets the response listener run while waiting
+                page.wait_for_timeout(IN_PROGRESS_POLL_MS)
+    finally:
+        page.remove_listener("response", on_response)
+
+
+async def expand_in_progress_async(page, button):
+    """Async counterpart of expand_in_progress()"""
+    responses = []
+
+    def on_response(response):
+        if is_in_progress_response(response):
+            responses.append(response)
+
+    page.on("response", on_response)
+    try:
+        with get_metrics().span("wait.in_progress_links"):
+            await button.click()
+            deadline = time.monotonic() + IN_PROGRESS_TIMEOUT
+            while True:
+                while responses:
+                    links = await links_from_response_async(responses.pop(0))
+                    if links:
+                        return links
+                if await page.query_selector(IN_PROGRESS_LINKS):
+                    return None
+                if time.monotonic() >= deadline:
+                    raise TransientError("In-progress list did not load")
+                await page.wait_for_timeout(IN_PROGRESS_POLL_MS)
+    finally:
+        page.remove_listener("response", on_response)
+
+
+def details_from_document(html):
+    """(title, description) from the page's own HTML response, or None.
+
+    The job fields are usually in the server-rendered document already, so
+    there is no need to wait for the browser to render them.
+    """
+    if not html:
+        return None
+    job = parse_job_page(html)
+    if job["title"] and job["description"]:
+        get_metrics().incr("readiness.document")
+        return job["title"], job["description"]
+    return None
@@ -0,0 +1,169 @@
+import os
+import time
+from urllib.parse import urlparse
+
+DEFAULT_BLOCKED_RESOURCE_TYPES = ("image", "media", "font", "stylesheet")
+
+DEFAULT_BLOCKED_DOMAINS = (
+    "google-analytics.com",
+    "googletagmanager.com",
+    "doubleclick.net",
+    "facebook.net",
+    "facebook.com",
+    "hotjar.com",
+    "segment.io",
+    "segment.com",
+    "bat.bing.com",
+    "heapanalytics.com",
+    "sentry.io",
+    "onetrust.com",
+    "cookielaw.org",
+)
+
+# Aborted requests never report a size, so savings are estimated from
+# typical transfer sizes per resource type
+ESTIMATED_RESOURCE_BYTES = {
+    "image": 35_000,
+    "media": 250_000,
+    "font": 40_000,
+    "stylesheet": 30_000,
+    "script": 60_000,
+}
+DEFAULT_ESTIMATED_BYTES = 5_000
+
+
+def _env_list(name, default):
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return tuple(item.strip() for item in value.split(",") if item.strip())
+
+
+class PageStats:
+    """Request counters for one page"""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.load_seconds = None
+        self.loaded_requests = 0
+        self.loaded_bytes = 0
+        self.blocked_requests = 0
+        self.blocked_bytes = 0
+
+    def on_load(self):
+        if self.load_seconds is None:
+            self.load_seconds = time.monotonic() - self.started
+
+    def on_response(self, response):
+        self.loaded_requests += 1
+        self.loaded_bytes += int(response.headers.get("content-length") or 0)
+
+    def saved_seconds(self):
+        """Estimate time saved from the page's observed transfer rate"""
+        if not self.load_seconds or not self.loaded_bytes:
+            return 0.0
+        return self.blocked_bytes / (self.loaded_bytes / self.load_seconds)
+
+
+class ResourceBlocker:
+    """Aborts requests for resource types and domains the scraper never reads"""
+
+    def __init__(
+        self,
+        resource_types=DEFAULT_BLOCKED_RESOURCE_TYPES,
+        domains=DEFAULT_BLOCKED_DOMAINS,
+        verbose=True,
+    ):
+        self.resource_types = set(resource_types)
+        self.domains = tuple(domains)
+        self.verbose = verbose
+        self.pages = 0
+        self.blocked_requests = 0
+        self.blocked_bytes = 0
+        self.saved_seconds = 0.0
+
+    @classmethod
+    def from_env(cls):
+        """Create a blocker from UPWORK_BLOCK_* variables, or None when disabled"""
+        if os.getenv("UPWORK_BLOCK_RESOURCES", "1") == "0":
+            return None
+        return cls(
+            resource_types=_env_list(
+                "UPWORK_BLOCK_RESOURCE_TYPES", DEFAULT_BLOCKED_RESOURCE_TYPES
+            ),
+            domains=_env_list("UPWORK_BLOCK_DOMAINS", DEFAULT_BLOCKED_DOMAINS),
+        )
+
+    def should_block(self, resource_type, url):
+        if resource_type in self.resource_types:
+            return True
+        host = urlparse(url).hostname or ""
+        return any(
+            host == domain or host.endswith("." + domain) for domain in self.domains
+        )
+
+    def _check(self, stats, request):
+        if not self.should_block(request.resource_type, request.url):
+            return False
+        stats.blocked_requests += 1
+        stats.blocked_bytes += ESTIMATED_RESOURCE_BYTES.get(
+            request.resource_type, DEFAULT_ESTIMATED_BYTES
+        )
+        return True
+
+    def attach(self, page):
+        """Install request interception on a sync API page and return its stats"""
+        stats = PageStats()
+
+        def handle(route):
+            if self._check(stats, route.request):
+                route.abort()
+            else:
+                # Hand the request on, e.g. to the asset cache
+                route.fallback()
+
+        page.route("**/*", handle)
+        page.on("response", stats.on_response)
+        page.on("load", lambda _: stats.on_load())
+        return stats
+
+    async def attach_async(self, page):
+        """Install request interception on an async API page and return its stats"""
+        stats = PageStats()
+
+        async def handle(route):
+            if self._check(stats, route.request):
+                await route.abort()
+            else:
+                await route.fallback()
+
+        await page.route("**/*", handle)
+        page.on("response", stats.on_response)
+        page.on("load", lambda _: stats.on_load())
+        return stats
+
+    def finish(self, stats):
+        """Fold a closed page's stats into the run totals and report them"""
+        saved_seconds = stats.saved_seconds()
+        self.pages += 1
+        self.blocked_requests += stats.blocked_requests
+        self.blocked_bytes += stats.blocked_bytes
+        self.saved_seconds += saved_seconds
+        if self.verbose and stats.blocked_requests:
+            print(
+                f"Blocked {stats.blocked_requests} requests "
+                f"(~{stats.blocked_bytes / 1024:.0f} KB, ~{saved_seconds:.1f}s saved), "
+                f"loaded {stats.loaded_requests} requests "
+                f"({stats.loaded_bytes / 1024:.0f} KB)"
+            )
+
+    def report(self):
+        """Print the run totals"""
+        if not self.pages:
+            return
+        print(
+            f"\nResource blocking: {self.blocked_requests} requests blocked on "
+            f"{self.pages} pages, ~{self.blocked_bytes / 1024 / 1024:.1f} MB and "
+            f"~{self.saved_seconds:.0f}s saved "
+            f"(~{self.blocked_bytes / self.pages / 1024:.0f} KB per page)"
+        )
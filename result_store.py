@@ -0,0 +1,276 @@
+import csv
+import os
+import sqlite3
+import threading
+import time
+from itertools import groupby
+from config import job_key
+
+CSV_FIELDS = [
+    "url",
+    "title",
+    "description",
+    "location",
+    "timestamp",
+    "source",
+    "in_progress_links",
+    "in_progress_titles",
+    "in_progress_descriptions",
+]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS parent_jobs (
+    url TEXT PRIMARY KEY,
+    run_id TEXT NOT NULL,
+    title TEXT,
+    description TEXT,
+    location TEXT,
+    timestamp TEXT,
+    source TEXT
+);
+CREATE INDEX IF NOT EXISTS parent_jobs_run_id ON parent_jobs (run_id);
+
+CREATE TABLE IF NOT EXISTS in_progress_jobs (
+    parent_url TEXT NOT NULL REFERENCES parent_jobs (url) ON DELETE CASCADE,
+    url TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    title TEXT,
+    description TEXT,
+    PRIMARY KEY (parent_url, url)
+);
+
+CREATE TABLE IF NOT EXISTS job_details (
+    job_key TEXT PRIMARY KEY,
+    run_id TEXT NOT NULL,
+    url TEXT NOT NULL,
+    title TEXT NOT NULL,
+    description TEXT NOT NULL,
+    fetched_at REAL NOT NULL
+);
+"""
+
+
+class ResultStore:
+    """SQLite store for parent jobs and their in-progress jobs, keyed by URL.
+
+    Every write is a single-row upsert, so updating one in-progress job no
+    longer rewrites the whole result file. Parents are tagged with the run
+    that scraped them and export_csv() writes one run's rows at the end.
+
+    Fetched job details are also cached by normalized job URL, so a job
+    listed under several parents is fetched once per run, or once per
+    details_cache_hours when that is set.
+
+    The connection may be shared between threads; every access, including
+    the frontier's and the seen index's, holds self.lock.
+    """
+
+    def __init__(self, path, run_id, details_cache_hours=0.0):
+        self.path = path
+        self.run_id = run_id
+        self.details_cache_seconds = details_cache_hours * 3600
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA foreign_keys = ON")
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.executescript(SCHEMA)
+
+    @classmethod
+    def from_env(cls, run_id):
+        """Open the store at UPWORK_DB_PATH (defaults to upwork_jobs.db)"""
+        return cls(
+            os.getenv("UPWORK_DB_PATH", "upwork_jobs.db"),
+            run_id,
+            float(os.getenv("UPWORK_DETAILS_CACHE_HOURS", "0")),
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        self.conn.close()
+
+    def parent_count(self):
+        """Number of parent jobs scraped in this run"""
+        with self.lock:
+            return self.conn.execute(
+                "SELECT COUNT(*) FROM parent_jobs WHERE run_id = ?", (self.run_id,)
+            ).fetchone()[0]
+
+    def save_parent(self, job_data):
+        """Upsert a parent job and the list of its in-progress links.
+
+        Details already fetched for links that are still listed are kept.
+        """
+        with self.lock:
+            links = job_data.get("in_progress_links") or []
+            with self.conn:
+                self.conn.execute(
+                    """
+                    INSERT INTO parent_jobs
+                        (url, run_id, title, description, location, timestamp, source)
+                    VALUES (:url, :run_id, :title, :description, :location, :timestamp, :source)
+                    ON CONFLICT (url) DO UPDATE SET
+                        run_id = excluded.run_id,
+                        title = excluded.title,
+                        description = excluded.description,
+                        location = excluded.location,
+                        timestamp = excluded.timestamp,
+                        source = excluded.source
+                    """,
+                    {**job_data, "run_id": self.run_id},
+                )
+                self.conn.execute(
+                    f"""
+                    DELETE FROM in_progress_jobs
+                    WHERE parent_url = ? AND url NOT IN ({",".join("?" * len(links))})
+                    """,
+                    [job_data["url"], *links],
+                )
+                self.conn.executemany(
+                    """
+                    INSERT INTO in_progress_jobs (parent_url, url, position)
+                    VALUES (?, ?, ?)
+                    ON CONFLICT (parent_url, url) DO UPDATE SET position = excluded.position
+                    """,
+                    [(job_data["url"], link, i) for i, link in enumerate(links)],
+                )
+
+    def save_in_progress_details(self, parent_url, url, title, description):
+        """Store the title and description of one in-progress job"""
+        with self.lock:
+            with self.conn:
+                cursor = self.conn.execute(
+                    """
+                    UPDATE in_progress_jobs SET title = ?, description = ?
+                    WHERE parent_url = ? AND url = ?
+                    """,
+                    (title, description, parent_url, url),
+                )
+            if cursor.rowcount == 0:
+                print(f"Link {url} not found in parent job {parent_url}")
+
+    def reuse_in_progress_details(self, parent_url, url):
+        """Copy the latest known details of an in-progress job from any parent"""
+        with self.lock:
+            with self.conn:
+                self.conn.execute(
+                    """
+                    UPDATE in_progress_jobs
+                    SET (title, description) = (
+                        SELECT title, description FROM in_progress_jobs
+                        WHERE url = ? AND title IS NOT NULL
+                        ORDER BY rowid DESC LIMIT 1
+                    )
+                    WHERE parent_url = ? AND url = ? AND title IS NULL
+                    """,
+                    (url, parent_url, url),
+                )
+
+    def cached_details(self, url):
+        """(title, description) of a job already fetched in this run (or cache window)"""
+        with self.lock:
+            row = self.conn.execute(
+                """
+                SELECT title, description FROM job_details
+                WHERE job_key = ? AND (run_id = ? OR fetched_at >= ?)
+                """,
+                (job_key(url), self.run_id, time.time() - self.details_cache_seconds),
+            ).fetchone()
+            return (row["title"], row["description"]) if row else None
+
+    def cache_details(self, url, title, description):
+        """Remember the details fetched for a job"""
+        if not title or not description:
+            return
+        with self.lock:
+            with self.conn:
+                self.conn.execute(
+                    """
+                    INSERT INTO job_details
+                        (job_key, run_id, url, title, description, fetched_at)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (job_key) DO UPDATE SET
+                        run_id = excluded.run_id,
+                        url = excluded.url,
+                        title = excluded.title,
+                        description = excluded.description,
+                        fetched_at = excluded.fetched_at
+                    """,
+                    (job_key(url), self.run_id, url, title, description, time.time()),
+                )
+
+    def iter_jobs(self, url=None):
+        """Yield this run's parent jobs (or just url) with their in-progress jobs.
+
+        Records are built one parent at a time from a database cursor, so the
+        run never has to fit in memory:
+
+            {"url", "title", "description", "location", "timestamp", "source",
+             "in_progress": [{"url", "title", "description"}, ...]}
+        """
+        with self.lock:
+            rows = self.conn.execute(
+                f"""
+                SELECT p.*, c.url AS child_url, c.title AS child_title,
+                       c.description AS child_description
+                FROM parent_jobs p
+                LEFT JOIN in_progress_jobs c ON c.parent_url = p.url
+                WHERE p.run_id = ? {"AND p.url = ?" if url else ""}
+                ORDER BY p.rowid, c.position
+                """,
+                (self.run_id, url) if url else (self.run_id,),
+            )
+            for url, group in groupby(rows, key=lambda row: row["url"]):
+                group = list(group)
+                yield {
+                    "url": url,
+                    "title": group[0]["title"],
+                    "description": group[0]["description"],
+                    "location": group[0]["location"],
+                    "timestamp": group[0]["timestamp"],
+                    "source": group[0]["source"],
+                    "in_progress": [
+                        {
+                            "url": row["child_url"],
+                            "title": row["child_title"],
+                            "description": row["child_description"],
+                        }
+                        for row in group
+                        if row["child_url"]
+                    ],
+                }
+
+    def job(self, url):
+        """Return one parent job of this run as an iter_jobs() record, or None"""
+        jobs = list(self.iter_jobs(url))
+        return jobs[0] if jobs else None
+
+    def export_csv(self, filename):
+        """Write this run's jobs to a CSV file and return the number of rows"""
+        count = 0
+        with open(filename, "w", newline="", encoding="utf-8") as file:
+            writer = csv.DictWriter(file, fieldnames=CSV_FIELDS)
+            writer.writeheader()
+            for job in self.iter_jobs():
+                children = job.pop("in_progress")
+                writer.writerow(
+                    {
+                        **job,
+                        "in_progress_links": " ; ".join(
+                            child["url"] for child in children
+                        ),
+                        "in_progress_titles": " ; ".join(
+                            child["title"] or "" for child in children
+                        ),
+                        "in_progress_descriptions": " ; ".join(
+                            child["description"] or "" for child in children
+                        ),
+                    }
+                )
+                count += 1
+        return count
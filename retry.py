@@ -0,0 +1,215 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from metrics import get_metrics
+
+PERMANENT = "permanent"
+TRANSIENT = "transient"
+BLOCKED = "blocked"
+
+
+class ScrapeError(Exception):
+    """A failed page load, classified by whether retrying can help"""
+
+    kind = TRANSIENT
+
+
+class PermanentError(ScrapeError):
+    """The page is gone or will never have what we need (404, missing content)"""
+
+    kind = PERMANENT
+
+
+class TransientError(ScrapeError):
+    """A failure that may well go away on the next attempt (timeouts, 5xx)"""
+
+    kind = TRANSIENT
+
+
+class BlockedError(ScrapeError):
+    """The site is refusing us (CAPTCHA, 403, 429)"""
+
+    kind = BLOCKED
+
+
+def classify(error):
+    """Return PERMANENT, TRANSIENT or BLOCKED for an exception"""
+    if isinstance(error, ScrapeError):
+        return error.kind
+    # Anything else, e.g. Playwright timeouts and net::ERR_... errors, is
+    # worth another try
+    return TRANSIENT
+
+
+def raise_for_status(status, url):
+    """Raise the classified error for a non-200 page status"""
+    if status is None or status == 200:
+        return
+    message = f"Page returned status code {status} for {url}"
+    if status in (404, 410):
+        raise PermanentError(message)
+    if status in (401, 403, 429):
+        raise BlockedError(message)
+    raise TransientError(message)
+
+
+class CircuitBreaker:
+    """Pauses the whole crawl when blocks cluster.
+
+    After threshold blocked responses within window seconds the circuit
+    opens and every caller waits for cooldown seconds before its next
+    attempt. A block right after a pause opens it again for twice as long,
+    up to max_cooldown; a success resets the cooldown.
+    """
+
+    def __init__(self, threshold=3, window=300.0, cooldown=300.0, max_cooldown=3600.0):
+        self.threshold = threshold
+        self.window = window
+        self.base_cooldown = cooldown
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.opened = 0
+        self._blocks = []
+        self._open_until = 0.0
+        self._half_open = False
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """Create a breaker configured from UPWORK_BREAKER_* environment variables"""
+        return cls(
+            threshold=int(os.getenv("UPWORK_BREAKER_THRESHOLD", "3")),
+            window=float(os.getenv("UPWORK_BREAKER_WINDOW", "300")),
+            cooldown=float(os.getenv("UPWORK_BREAKER_COOLDOWN", "300")),
+        )
+
+    def remaining(self):
+        """Seconds left until the circuit closes again"""
+        with self._lock:
+            return max(0.0, self._open_until - time.monotonic())
+
+    def record_block(self):
+        with self._lock:
+            now = time.monotonic()
+            if now < self._open_until:
+                # Requests already in flight when the circuit opened
+                return
+            if self._half_open:
+                # Still blocked right after a pause: back off harder
+                self.cooldown = min(self.max_cooldown, self.cooldown * 2)
+                self._open(now)
+                return
+            self._blocks = [t for t in self._blocks if t > now - self.window]
+            self._blocks.append(now)
+            if len(self._blocks) >= self.threshold:
+                self._open(now)
+
+    def record_success(self):
+        with self._lock:
+            self._half_open = False
+            self.cooldown = self.base_cooldown
+
+    def _open(self, now):
+        self._open_until = now + self.cooldown
+        self._blocks = []
+        self._half_open = True
+        self.opened += 1
+        get_metrics().incr("circuit_breaker.opened")
+        print(
+            f"Circuit breaker open: repeated blocks, pausing the crawl for "
+            f"{self.cooldown:.0f}s"
+        )
+
+    def wait(self):
+        """Block while the circuit is open"""
+        delay = self.remaining()
+        if delay:
+            get_metrics().add_sleep("circuit_breaker", delay)
+            time.sleep(delay)
+
+    async def wait_async(self):
+        delay = self.remaining()
+        if delay:
+            get_metrics().add_sleep("circuit_breaker", delay)
+            await asyncio.sleep(delay)
+
+
+_breaker = None
+_breaker_lock = threading.Lock()
+
+
+def get_circuit_breaker():
+    """Return the process-wide circuit breaker shared by every scraper"""
+    global _breaker
+    with _breaker_lock:
+        if _breaker is None:
+            _breaker = CircuitBreaker.from_env()
+        return _breaker
+
+
+class RetryPolicy:
+    """Retries transient and blocked failures with jittered exponential backoff.
+
+    Permanent failures are raised right away. Blocked failures are reported
+    to the circuit breaker, and every attempt first waits for the breaker to
+    close. The delay before retry n is drawn uniformly from
+    [0, min(max_delay, base_delay * 2 ** n)] ("full jitter").
+    """
+
+    def __init__(self, max_attempts=3, base_delay=2.0, max_delay=60.0, breaker=None):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.breaker = breaker or get_circuit_breaker()
+
+    @classmethod
+    def from_env(cls, max_attempts=3):
+        return cls(
+            max_attempts=max_attempts,
+            base_delay=float(os.getenv("UPWORK_RETRY_BASE_DELAY", "2")),
+            max_delay=float(os.getenv("UPWORK_RETRY_MAX_DELAY", "60")),
+        )
+
+    def delay(self, attempt):
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+    def _failed(self, error, attempt, stage):
+        """Record a failed attempt; returns the backoff delay, or raises"""
+        kind = classify(error)
+        metrics = get_metrics()
+        metrics.incr(f"failures.{kind}")
+        print(f"Attempt {attempt + 1} of {stage} failed ({kind}): {error}")
+        if kind == BLOCKED:
+            self.breaker.record_block()
+        if kind == PERMANENT or attempt == self.max_attempts - 1:
+            raise error
+        metrics.incr(f"retries.{stage}")
+        return self.delay(attempt)
+
+    def call(self, attempt_fn, stage):
+        """Return attempt_fn(attempt), retrying classified failures"""
+        for attempt in range(self.max_attempts):
+            self.breaker.wait()
+            try:
+                result = attempt_fn(attempt)
+            except Exception as e:
+                get_metrics().sleep(self._failed(e, attempt, stage), "retry_backoff")
+                continue
+            self.breaker.record_success()
+            return result
+
+    async def call_async(self, attempt_fn, stage):
+        """Async counterpart of call() for coroutine functions"""
+        for attempt in range(self.max_attempts):
+            await self.breaker.wait_async()
+            try:
+                result = await attempt_fn(attempt)
+            except Exception as e:
+                await get_metrics().sleep_async(
+                    self._failed(e, attempt, stage), "retry_backoff"
+                )
+                continue
+            self.breaker.record_success()
+            return result
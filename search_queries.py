@@ -0,0 +1,228 @@
+import itertools
+import json
+import os
+import queue
+import threading
+from browser_pool import BrowserPool, use_pool
+from config import job_key
+from frontier import SEARCH
+from metrics import get_metrics
+from parent_jobs import SEARCH_PARAMS, iter_parent_job_links, search_url
+
+
+class SearchQuery:
+    """One job search: a name for the logs and its search URL parameters"""
+
+    def __init__(self, name, params):
+        self.name = name
+        self.params = params
+        # The first results page identifies the query in the frontier
+        self.url = search_url(params=params)
+
+    def __repr__(self):
+        return f"SearchQuery({self.name!r})"
+
+
+def expand_spec(spec):
+    """Turn a query spec into SearchQuery objects.
+
+    The spec is a JSON object with up to three keys:
+
+        {"base": {...}, "dimensions": {param: [value, ...], ...},
+         "queries": [{"name": ..., "params": {...}}, ...]}
+
+    Every combination of the dimension values (categories, keyword sets,
+    budget bands, regions...) is one query on top of the base parameters.
+    Explicit queries are added as they are, also on top of the base.
+    """
+    base = spec.get("base", SEARCH_PARAMS)
+    queries = []
+
+    dimensions = spec.get("dimensions") or {}
+    names = list(dimensions)
+    for values in itertools.product(*(dimensions[name] for name in names)):
+        params = dict(base, **dict(zip(names, values)))
+        queries.append(SearchQuery(" ".join(str(value) for value in values), params))
+
+    for i, entry in enumerate(spec.get("queries") or [], 1):
+        queries.append(
+            SearchQuery(entry.get("name", f"query-{i}"), dict(base, **entry["params"]))
+        )
+
+    # Two spellings of the same search are still one search
+    unique = {query.url: query for query in queries}
+    return list(unique.values()) or [SearchQuery("default", dict(base))]
+
+
+def load_queries(path=None):
+    """Queries from the UPWORK_QUERIES_FILE spec, or the built-in single search"""
+    path = path or os.getenv("UPWORK_QUERIES_FILE")
+    if not path:
+        return [SearchQuery("default", SEARCH_PARAMS)]
+    with open(path, encoding="utf-8") as f:
+        queries = expand_spec(json.load(f))
+    print(f"Loaded {len(queries)} search queries from {path}")
+    return queries
+
+
+def pending_queries(frontier, queries):
+    """The queries this run has not finished discovering yet"""
+    return [query for query in queries if not frontier.is_done(SEARCH, query.url)]
+
+
+def _discover_query(query, cookies, pool, found, stop, **options):
+    """Put (query, link, None) for each job link, then (query, None, error or None)"""
+    try:
+        for link in iter_parent_job_links(
+            cookies, pool, params=query.params, **options
+        ):
+            if stop.is_set():
+                return
+            found.put((query, link, None))
+    except Exception as e:
+        found.put((query, None, e))
+        return
+    found.put((query, None, None))
+
+
+def _discovery_worker(todo, cookies, found, stop, options):
+    """Search queries from todo, then put (None, None, error or None) when done"""
+    try:
+        # Sync Playwright objects belong to the thread that created them, so
+        # each worker runs a browser pool of its own
+        with BrowserPool.from_env(cookies) as pool:
+            while not stop.is_set():
+                try:
+                    query = todo.get_nowait()
+                except queue.Empty:
+                    break
+                _discover_query(query, cookies, pool, found, stop, **options)
+    except Exception as e:
+        # The queries this worker did not take are left to the others
+        found.put((None, None, e))
+        return
+    found.put((None, None, None))
+
+
+def _fan_out(queries, cookies, pool, parallel, options):
+    """Yield (query, link, error) from every query, parallel queries at a time"""
+    if parallel <= 1 or len(queries) == 1:
+        with use_pool(pool, cookies) as pool:
+            for query in queries:
+                try:
+                    for link in iter_parent_job_links(
+                        cookies, pool, params=query.params, **options
+                    ):
+                        yield query, link, None
+                except Exception as e:
+                    yield query, None, e
+                    continue
+                yield query, None, None
+        return
+
+    todo = queue.SimpleQueue()
+    for query in queries:
+        todo.put(query)
+    found = queue.Queue()
+    stop = threading.Event()
+    threads = [
+        threading.Thread(
+            target=_discovery_worker,
+            args=(todo, cookies, found, stop, options),
+            name=f"discovery-{i + 1}",
+            daemon=True,
+        )
+        for i in range(min(parallel, len(queries)))
+    ]
+    for thread in threads:
+        thread.start()
+    try:
+        # Every worker ends with a (None, None, error) message
+        running, worker_error = len(threads), None
+        while running:
+            query, link, error = found.get()
+            if query is None:
+                running -= 1
+                worker_error = error or worker_error
+                continue
+            yield query, link, error
+
+        # Queries no worker got to, e.g. when no browser would start
+        while True:
+            try:
+                query = todo.get_nowait()
+            except queue.Empty:
+                break
+            yield query, None, worker_error or RuntimeError("No discovery worker")
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+
+def unseen_stop(stop_at, seen):
+    """stop_at for one query's pages, skipping jobs other queries already found.
+
+    Each query stops at its own first already-scraped job. A job found by an
+    overlapping query in this run is only a duplicate and must not end the
+    query, or its jobs further down would never be discovered.
+    """
+    if not stop_at:
+        return None
+    # seen is filled by the consumer; with parallel queries it is read from
+    # the worker threads, where a stale read only delays a stop
+    return lambda link: job_key(link) not in seen and stop_at(link)
+
+
+def discover_links(
+    frontier,
+    cookies,
+    pool=None,
+    queries=None,
+    parallel=1,
+    per_page=10,
+    max_pages=5,
+    stop_at=None,
+):
+    """Yield the job links of every pending query, merged and deduplicated.
+
+    Queries run parallel at a time, each worker thread with its own browser;
+    links are yielded as their listing pages arrive. A job found by several
+    overlapping queries is yielded once. Each query is marked done or failed
+    in the frontier on its own, so a resumed run only repeats the failed
+    ones.
+    """
+    queries = pending_queries(frontier, queries or load_queries())
+    if not queries:
+        return
+    frontier.add(SEARCH, [query.url for query in queries])
+
+    seen = set()
+    options = {
+        "per_page": per_page,
+        "max_pages": max_pages,
+        "stop_at": unseen_stop(stop_at, seen),
+    }
+    duplicates = 0
+    for query, link, error in _fan_out(queries, cookies, pool, parallel, options):
+        if link is None:
+            if error:
+                frontier.mark_failed(SEARCH, query.url, error=error)
+                print(f"Error getting job links for query {query.name}: {error}")
+            else:
+                frontier.mark_done(SEARCH, query.url)
+            continue
+
+        key = job_key(link)
+        if key in seen:
+            duplicates += 1
+            get_metrics().incr("discovery.duplicates")
+            continue
+        seen.add(key)
+        yield link
+
+    if len(queries) > 1:
+        print(
+            f"Discovered {len(seen)} unique jobs from {len(queries)} queries "
+            f"({duplicates} duplicates across queries)"
+        )
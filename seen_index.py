@@ -0,0 +1,94 @@
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS seen_urls (
+    url TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    last_scraped_at REAL NOT NULL
+);
+"""
+
+
+class SeenIndex:
+    """Cross-run record of when each job URL was last scraped successfully"""
+
+    def __init__(self, conn, ttl_hours=24.0, lock=None):
+        self.conn = conn
+        self.lock = lock or threading.RLock()
+        self.ttl_seconds = ttl_hours * 3600
+        self.conn.executescript(SCHEMA)
+
+    def last_scraped(self, urls):
+        """Return {url: last_scraped_at} for the URLs that were scraped before"""
+        with self.lock:
+            urls = list(urls)
+            result = {}
+            # Stay well below SQLite's host parameter limit
+            for start in range(0, len(urls), 500):
+                chunk = urls[start : start + 500]
+                rows = self.conn.execute(
+                    f"""
+                    SELECT url, last_scraped_at FROM seen_urls
+                    WHERE url IN ({",".join("?" * len(chunk))})
+                    """,
+                    chunk,
+                ).fetchall()
+                result.update((row[0], row[1]) for row in rows)
+            return result
+
+    def is_fresh(self, url):
+        """Whether the URL was scraped within the TTL"""
+        last_scraped_at = self.last_scraped([url]).get(url)
+        return (
+            last_scraped_at is not None
+            and last_scraped_at >= time.time() - self.ttl_seconds
+        )
+
+    def fresh_before(self, started_at):
+        """is_fresh() as it stood at started_at, for stopping discovery.
+
+        Jobs scraped since started_at, i.e. by the current run, do not count.
+        Under sort=recency such a job can move onto a later page when new jobs
+        are posted, and stopping there would skip the jobs not seen yet.
+        """
+        cutoff = started_at - self.ttl_seconds
+
+        def fresh(url):
+            last_scraped_at = self.last_scraped([url]).get(url)
+            return (
+                last_scraped_at is not None and cutoff <= last_scraped_at < started_at
+            )
+
+        return fresh
+
+    def prioritize(self, urls):
+        """Split URLs into (to_fetch, fresh).
+
+        to_fetch lists never-seen URLs first, in their original order, then
+        URLs whose last scrape is older than the TTL, oldest first. fresh holds
+        the URLs scraped within the TTL, which don't need fetching again.
+        """
+        urls = list(dict.fromkeys(url for url in urls if url))
+        seen = self.last_scraped(urls)
+        cutoff = time.time() - self.ttl_seconds
+
+        new = [url for url in urls if url not in seen]
+        stale = sorted(
+            (url for url in urls if url in seen and seen[url] < cutoff),
+            key=lambda url: seen[url],
+        )
+        fresh = [url for url in urls if url in seen and seen[url] >= cutoff]
+        return new + stale, fresh
+
+    def mark(self, url, kind):
+        """Record a successful scrape of the URL"""
+        with self.lock:
+            with self.conn:
+                self.conn.execute(
+                    """
+                    INSERT INTO seen_urls (url, kind, last_scraped_at) VALUES (?, ?, ?)
+                    ON CONFLICT (url) DO UPDATE SET last_scraped_at = excluded.last_scraped_at
+                    """,
+                    (url, kind, time.time()),
+                )
@@ -0,0 +1,244 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from metrics import get_metrics
+
+
+def _write_json(path, data):
+    """Replace path atomically, so concurrent readers never see half a file"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+class SessionStore:
+    """Playwright storage state (cookies and localStorage) kept across contexts and runs.
+
+    New contexts start from the latest saved state, so they reuse the
+    Cloudflare and session cookies earlier contexts negotiated. The env
+    cookies are only added for names the state does not have yet, so
+    cookies the site has rotated since are not overwritten. Contexts save
+    their state when it changes, at most every save_seconds and when
+    they are closed.
+
+    There is one file per account in directory, named by a hash of the
+    account's master_access_token. Logging in again therefore starts from
+    a clean state. Saved state older than max_age_hours is ignored.
+    """
+
+    def __init__(self, directory, cookies, save_seconds=60.0, max_age_hours=24.0):
+        token = next(
+            (c["value"] for c in cookies or [] if c["name"] == "master_access_token"),
+            "",
+        )
+        account = hashlib.sha256(token.encode()).hexdigest()[:16]
+        self.path = os.path.join(directory, f"{account}.json")
+        self.cookies = cookies or []
+        self.save_seconds = save_seconds
+        self.max_age_seconds = max_age_hours * 3600
+        self._state = None
+        self._mtime = None
+        self._saved_at = 0.0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, cookies):
+        """Create a store from UPWORK_SESSION_* variables, or None when disabled"""
+        if os.getenv("UPWORK_PERSIST_SESSION", "1") == "0":
+            return None
+        return cls(
+            os.path.join(os.getenv("UPWORK_CACHE_DIR", ".upwork_cache"), "sessions"),
+            cookies,
+            save_seconds=float(os.getenv("UPWORK_SESSION_SAVE_SECONDS", "60")),
+            max_age_hours=float(os.getenv("UPWORK_SESSION_MAX_AGE_HOURS", "24")),
+        )
+
+    def state(self):
+        """The latest saved storage state, including other processes' saves"""
+        with self._lock:
+            try:
+                mtime = os.stat(self.path).st_mtime
+            except FileNotFoundError:
+                return self._state
+            if time.time() - mtime > self.max_age_seconds:
+                return None
+            if mtime != self._mtime:
+                try:
+                    with open(self.path, encoding="utf-8") as f:
+                        self._state = json.load(f)
+                    self._mtime = mtime
+                except (OSError, ValueError) as e:
+                    print(f"Ignoring unreadable session state {self.path}: {e}")
+            return self._state
+
+    def context_options(self):
+        """Keyword arguments for browser.new_context()"""
+        state = self.state()
+        if state:
+            get_metrics().incr("session.reused")
+            return {"storage_state": state}
+        return {}
+
+    def missing_cookies(self, state):
+        """Env cookies the storage state does not have yet"""
+        present = {cookie["name"] for cookie in (state or {}).get("cookies", [])}
+        return [cookie for cookie in self.cookies if cookie["name"] not in present]
+
+    def _due(self, force):
+        return force or time.monotonic() - self._saved_at >= self.save_seconds
+
+    def _store(self, state):
+        with self._lock:
+            self._saved_at = time.monotonic()
+            if state == self._state:
+                return
+            _write_json(self.path, state)
+            self._state = state
+            self._mtime = os.stat(self.path).st_mtime
+        get_metrics().incr("session.saved")
+
+    def save(self, context, force=False):
+        """Save a sync API context's state if it is due and has changed"""
+        if not self._due(force):
+            return
+        try:
+            self._store(context.storage_state())
+        except Exception as e:
+            print(f"Could not save session state: {e}")
+
+    async def save_async(self, context, force=False):
+        if not self._due(force):
+            return
+        try:
+            self._store(await context.storage_state())
+        except Exception as e:
+            print(f"Could not save session state: {e}")
+
+
+class AssetCache:
+    """On-disk cache of static assets (scripts by default) shared by every context.
+
+    Browser contexts are incognito, so Chromium's own cache starts empty each
+    time. Requests of the cached resource types are answered from disk when
+    a copy younger than max_age_hours exists. Otherwise they are fetched
+    and stored if the response allows it. Other requests fall through to
+    the next route handler.
+    """
+
+    def __init__(self, directory, resource_types=("script",), max_age_hours=24.0):
+        self.directory = directory
+        self.resource_types = set(resource_types)
+        self.max_age_seconds = max_age_hours * 3600
+        self.hits = 0
+        self.misses = 0
+        self.bytes_served = 0
+        os.makedirs(directory, exist_ok=True)
+
+    @classmethod
+    def from_env(cls):
+        """Create a cache from UPWORK_ASSET_CACHE* variables, or None when disabled"""
+        if os.getenv("UPWORK_ASSET_CACHE", "1") == "0":
+            return None
+        types = os.getenv("UPWORK_ASSET_CACHE_TYPES", "script")
+        return cls(
+            os.path.join(os.getenv("UPWORK_CACHE_DIR", ".upwork_cache"), "assets"),
+            resource_types=[t.strip() for t in types.split(",") if t.strip()],
+            max_age_hours=float(os.getenv("UPWORK_ASSET_CACHE_HOURS", "24")),
+        )
+
+    def _path(self, url):
+        return os.path.join(self.directory, hashlib.sha256(url.encode()).hexdigest())
+
+    def _cacheable(self, request):
+        return request.method == "GET" and request.resource_type in self.resource_types
+
+    def lookup(self, url):
+        """(headers, body) of a fresh cached copy of url, or None"""
+        path = self._path(url)
+        try:
+            if time.time() - os.stat(path).st_mtime > self.max_age_seconds:
+                return None
+            with open(f"{path}.json", encoding="utf-8") as f:
+                headers = json.load(f)
+            with open(path, "rb") as f:
+                body = f.read()
+        except (OSError, ValueError):
+            return None
+        self.hits += 1
+        self.bytes_served += len(body)
+        get_metrics().incr("asset_cache.hits")
+        return headers, body
+
+    def store(self, url, status, headers, body):
+        self.misses += 1
+        get_metrics().incr("asset_cache.misses")
+        cache_control = headers.get("cache-control", "").lower()
+        if status != 200 or "no-store" in cache_control or "set-cookie" in headers:
+            return
+        path = self._path(url)
+        _write_json(f"{path}.json", headers)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(body)
+        # The body goes last: its mtime marks the entry as complete
+        os.replace(tmp, path)
+
+    def attach(self, page):
+        """Serve a sync API page's cacheable requests from disk"""
+
+        def handle(route):
+            request = route.request
+            if not self._cacheable(request):
+                route.fallback()
+                return
+            cached = self.lookup(request.url)
+            if cached:
+                headers, body = cached
+                route.fulfill(status=200, headers=headers, body=body)
+                return
+            try:
+                response = route.fetch()
+            except Exception:
+                # Let the request fail (or succeed) the usual way
+                route.fallback()
+                return
+            self.store(request.url, response.status, response.headers, response.body())
+            route.fulfill(response=response)
+
+        page.route("**/*", handle)
+
+    async def attach_async(self, page):
+        """Async counterpart of attach()"""
+
+        async def handle(route):
+            request = route.request
+            if not self._cacheable(request):
+                await route.fallback()
+                return
+            cached = self.lookup(request.url)
+            if cached:
+                headers, body = cached
+                await route.fulfill(status=200, headers=headers, body=body)
+                return
+            try:
+                response = await route.fetch()
+            except Exception:
+                await route.fallback()
+                return
+            self.store(
+                request.url, response.status, response.headers, await response.body()
+            )
+            await route.fulfill(response=response)
+
+        await page.route("**/*", handle)
+
+    def report(self):
+        if self.hits or self.misses:
+            print(
+                f"Asset cache: {self.hits} hits ({self.bytes_served / 1024:.0f} KB "
+                f"from disk), {self.misses} misses"
+            )
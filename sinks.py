@@ -0,0 +1,198 @@
+import json
+import os
+import threading
+import time
+from metrics import get_metrics
+
+# "csv" is exported from the result store at the end of the run; the other
+# formats are streamed while the run goes on
+FORMATS = ("csv", "jsonl", "parquet")
+STREAMING_FORMATS = ("jsonl", "parquet")
+
+
+class JsonlSink:
+    """Append-only JSON Lines file with one parent job per line.
+
+    Lines are fsynced in batches: every fsync_every records or after
+    fsync_seconds, whichever comes first. A crash loses at most one batch.
+    A resumed run appends to the same file. If a parent job is written
+    again, its later line replaces the earlier one.
+    """
+
+    def __init__(self, path, fsync_every=100, fsync_seconds=5.0):
+        self.path = path
+        self.fsync_every = fsync_every
+        self.fsync_seconds = fsync_seconds
+        self.count = 0
+        self._file = open(path, "a", encoding="utf-8")
+        self._unsynced = 0
+        self._synced_at = time.monotonic()
+
+    def write(self, record):
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.count += 1
+        self._unsynced += 1
+        if (
+            self._unsynced >= self.fsync_every
+            or time.monotonic() - self._synced_at >= self.fsync_seconds
+        ):
+            self.sync()
+
+    def sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._synced_at = time.monotonic()
+
+    def close(self):
+        self.sync()
+        self._file.close()
+
+
+def parquet_schema(pa):
+    """Nested schema: one row per parent job with a list of in-progress jobs"""
+    in_progress = pa.struct(
+        [
+            ("url", pa.string()),
+            ("title", pa.string()),
+            ("description", pa.string()),
+        ]
+    )
+    return pa.schema(
+        [
+            ("url", pa.string()),
+            ("title", pa.string()),
+            ("description", pa.string()),
+            ("location", pa.string()),
+            ("timestamp", pa.string()),
+            ("source", pa.string()),
+            ("in_progress", pa.list_(in_progress)),
+        ]
+    )
+
+
+class ParquetSink:
+    """Parquet file written one row group of row_group_size parent jobs at a time.
+
+    Needs the optional pyarrow package. A Parquet file cannot be appended
+    to, so a resumed run writes to a new numbered part file next to the
+    first one.
+    """
+
+    def __init__(self, path, row_group_size=1000):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError(
+                "Parquet output needs pyarrow (pip install pyarrow)"
+            ) from e
+
+        base, ext = os.path.splitext(path)
+        part = 1
+        while os.path.exists(path):
+            path = f"{base}.part{part}{ext}"
+            part += 1
+        self.path = path
+        self.row_group_size = row_group_size
+        self.count = 0
+        self._pa = pa
+        self._schema = parquet_schema(pa)
+        self._writer = pq.ParquetWriter(path, self._schema)
+        self._rows = []
+
+    def write(self, record):
+        self._rows.append(record)
+        self.count += 1
+        if len(self._rows) >= self.row_group_size:
+            self.flush()
+
+    def flush(self):
+        if self._rows:
+            table = self._pa.Table.from_pylist(self._rows, schema=self._schema)
+            self._writer.write_table(table)
+            self._rows = []
+
+    def close(self):
+        self.flush()
+        self._writer.close()
+
+
+def parse_formats(value):
+    """Split a comma-separated list of output formats, checking each one"""
+    formats = [name.strip().lower() for name in value.split(",") if name.strip()]
+    unknown = [name for name in formats if name not in FORMATS]
+    if unknown:
+        raise ValueError(
+            f"Unknown output format {', '.join(unknown)} "
+            f"(choose from {', '.join(FORMATS)})"
+        )
+    return formats
+
+
+class JobOutput:
+    """Streams finished parent jobs from the result store to the sinks.
+
+    The frontier calls parent_settled() when a parent job is done and none
+    of its in-progress jobs is pending anymore. The job is then read back
+    from the store and written to every sink. Nothing is held in memory
+    apart from the URLs already written.
+
+    A parent written while some of its in-progress jobs had failed but could
+    still be retried is written again once one of them is done. Readers keep
+    the last record per URL.
+    """
+
+    def __init__(self, store, sinks):
+        self.store = store
+        self.sinks = sinks
+        # {url: whether the record written was complete}
+        self._written = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def open(cls, store, formats):
+        """Open upwork_jobs_{run_id}.* sinks for the streaming formats, or None"""
+        sinks = []
+        prefix = f"upwork_jobs_{store.run_id}"
+        if "jsonl" in formats:
+            sinks.append(
+                JsonlSink(
+                    f"{prefix}.jsonl",
+                    fsync_every=int(os.getenv("UPWORK_JSONL_FSYNC_EVERY", "100")),
+                    fsync_seconds=float(os.getenv("UPWORK_JSONL_FSYNC_SECONDS", "5")),
+                )
+            )
+        if "parquet" in formats:
+            sinks.append(
+                ParquetSink(
+                    f"{prefix}.parquet",
+                    row_group_size=int(os.getenv("UPWORK_PARQUET_ROW_GROUP", "1000")),
+                )
+            )
+        return cls(store, sinks) if sinks else None
+
+    def parent_settled(self, url, complete=True):
+        with self._lock:
+            if self._written.get(url):
+                return
+            job = self.store.job(url)
+            if job is None:
+                return
+            self._written[url] = complete
+            record = self.record(job)
+            if record is None:
+                return
+            with get_metrics().span("output.write"):
+                for sink in self.sinks:
+                    sink.write(record)
+
+    def record(self, job):
+        """What to write for a finished job; None writes nothing"""
+        return job
+
+    def close(self):
+        with self._lock:
+            for sink in self.sinks:
+                sink.close()
+                print(f"Data streamed to file: {sink.path} ({sink.count} jobs)")
@@ -0,0 +1,57 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from http_fetch import (  # noqa: E402
+    SECURITY_CHECK_PATTERN,
+    parse_document,
+    parse_job_page,
+    select,
+)
+
+
+def fixture(name):
+    with open(os.path.join(ROOT, "fixtures", name), encoding="utf-8") as f:
+        return f.read()
+
+
+def test_parse_job_page_reads_the_saved_parent_page():
+    job = parse_job_page(fixture("parent.html"))
+
+    assert job["title"] == "Senior Python Developer for Data Pipeline"
+    # The <noscript> fallback is not part of the page a browser renders
+    assert job["description"] == (
+        "We are looking for an experienced Python developer to build and "
+        "maintain our data pipeline.\nBudget: $40-$60/hr."
+    )
+    # The local time next to the city is not part of the location
+    assert job["location"] == "United States + Austin"
+    # Only the first list section, without repeats
+    assert job["in_progress_links"] == [
+        "/jobs/ETL-automation_~0123456789abcdef01",
+        "/jobs/Airflow-DAG-review_~0123456789abcdef02",
+    ]
+
+
+def test_in_progress_links_left_to_the_browser():
+    html = fixture("parent.html")
+    start = html.index('<div class="air3-card-sections">')
+    end = html.index("</div>", start) + len("</div>")
+    job = parse_job_page(html[:start] + html[end:])
+
+    assert job["in_progress_links"] is None
+
+
+def test_select_nth_of_type():
+    root, _ = parse_document(fixture("parent.html"))
+    items = select(root, ".cfe-ui-job-about-client li:nth-of-type(2) strong")
+
+    assert [item.inner_text() for item in items] == ["12 jobs posted"]
+
+
+def test_security_check_only_on_challenge_pages():
+    # The parent page carries Cloudflare's bot detection script
+    assert not SECURITY_CHECK_PATTERN.search(fixture("parent.html"))
+    assert SECURITY_CHECK_PATTERN.search(fixture("challenge.html"))
@@ -0,0 +1,169 @@
+import hashlib
+import itertools
+import json
+import os
+import time
+from datetime import datetime
+from config import job_key
+from frontier import Frontier
+from metrics import get_metrics
+from seen_index import SeenIndex
+from sinks import JobOutput, JsonlSink
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS job_fingerprints (
+    job_key TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    fields TEXT NOT NULL,
+    first_seen REAL NOT NULL,
+    last_changed REAL NOT NULL
+);
+"""
+
+FINGERPRINT_FIELDS = ("title", "description", "location", "in_progress")
+
+
+def _digest(value):
+    return hashlib.sha256(json.dumps(value).encode()).hexdigest()[:16]
+
+
+def fingerprint_fields(job):
+    """{field: hash} of the parts of a job whose change is worth reporting"""
+    return {
+        "title": _digest(job["title"]),
+        "description": _digest(job["description"]),
+        "location": _digest(job["location"]),
+        # The set of in-progress jobs, however they are linked or ordered
+        "in_progress": _digest(
+            sorted(job_key(child["url"]) for child in job["in_progress"])
+        ),
+    }
+
+
+class ChangeFeed(JobOutput):
+    """Turns finished parent jobs into change events.
+
+    Every job's field hashes are kept in the job_fingerprints table. A job
+    never seen before is written as a "new" event. A job whose fingerprint
+    differs from the stored one is written as a "changed" event that lists
+    the changed fields. Jobs that did not change write nothing.
+    """
+
+    def __init__(self, store, sinks):
+        super().__init__(store, sinks)
+        self.events = {"new": 0, "changed": 0, "unchanged": 0}
+        with store.lock:
+            store.conn.executescript(SCHEMA)
+
+    @classmethod
+    def open(cls, store, path):
+        # Consumers tail the file, so every event is written out right away
+        return cls(store, [JsonlSink(path, fsync_every=1)])
+
+    def new_cycle(self):
+        """Forget which jobs the last cycle wrote; they may change again"""
+        with self._lock:
+            self._written = {}
+
+    def record(self, job):
+        fields = fingerprint_fields(job)
+        fingerprint = _digest(fields)
+        key = job_key(job["url"])
+        now = time.time()
+        conn = self.store.conn
+        with self.store.lock:
+            row = conn.execute(
+                "SELECT fingerprint, fields FROM job_fingerprints WHERE job_key = ?",
+                (key,),
+            ).fetchone()
+            if row and row["fingerprint"] == fingerprint:
+                self.events["unchanged"] += 1
+                return None
+            with conn:
+                conn.execute(
+                    """
+                    INSERT INTO job_fingerprints
+                        (job_key, url, fingerprint, fields, first_seen, last_changed)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (job_key) DO UPDATE SET
+                        url = excluded.url,
+                        fingerprint = excluded.fingerprint,
+                        fields = excluded.fields,
+                        last_changed = excluded.last_changed
+                    """,
+                    (key, job["url"], fingerprint, json.dumps(fields), now, now),
+                )
+
+        if row:
+            previous = json.loads(row["fields"])
+            changed = [
+                field
+                for field in FINGERPRINT_FIELDS
+                if previous.get(field) != fields[field]
+            ]
+            event = "changed"
+            print(f"Changed job ({', '.join(changed)}): {job['title']} {job['url']}")
+        else:
+            changed = list(FINGERPRINT_FIELDS)
+            event = "new"
+            print(f"New job: {job['title']} {job['url']}")
+        self.events[event] += 1
+        get_metrics().incr(f"watch.{event}")
+        return {
+            "event": event,
+            "detected_at": datetime.now().isoformat(),
+            "changed_fields": changed,
+            "job": job,
+        }
+
+
+def run_watch(store, run_cycle, interval, recheck_hours, max_attempts=3):
+    """Poll the search every interval seconds until interrupted.
+
+    Each cycle is a run of its own. Jobs checked within recheck_hours are
+    skipped, as in incremental mode, so a cycle only fetches new jobs and
+    jobs due for a recheck. run_cycle(frontier) scrapes one cycle. New and
+    changed jobs are appended to UPWORK_WATCH_EVENTS_FILE as each one
+    finishes.
+    """
+    seen = SeenIndex(store.conn, recheck_hours, store.lock)
+    feed = ChangeFeed.open(
+        store, os.getenv("UPWORK_WATCH_EVENTS_FILE", "upwork_changes.jsonl")
+    )
+    print(
+        f"Watching for new and changed jobs every {interval:.0f}s "
+        f"(events in {feed.sinks[0].path})"
+    )
+    try:
+        for cycle in itertools.count(1):
+            started = time.monotonic()
+            run_id = datetime.now().strftime("%Y%m%d_%H%M%S")
+            # Cycles shorter than a second would share the run id
+            if store.run_id.startswith(run_id):
+                run_id = f"{run_id}_{cycle}"
+            store.run_id = run_id
+            feed.new_cycle()
+            before = dict(feed.events)
+            frontier = Frontier(
+                store, max_attempts=max_attempts, seen=seen, output=feed
+            )
+
+            print(f"\nWatch cycle {store.run_id}")
+            try:
+                run_cycle(frontier)
+            except Exception as e:
+                # One failed cycle should not end the watch
+                print(f"Watch cycle failed: {e}")
+
+            counts = {name: feed.events[name] - before[name] for name in feed.events}
+            print(
+                f"Cycle done in {time.monotonic() - started:.0f}s: "
+                f"{counts['new']} new, {counts['changed']} changed, "
+                f"{counts['unchanged']} unchanged jobs"
+            )
+            remaining = interval - (time.monotonic() - started)
+            if remaining > 0:
+                get_metrics().sleep(remaining, "watch_interval")
+    finally:
+        feed.close()